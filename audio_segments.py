@@ -0,0 +1,182 @@
+"""
+Long-audio segmentation for the GenAI Tools app
+
+Splits WAV and MP3 recordings into overlapping segments in their own format
+(pure Python, no decoding) and stitches the segment transcripts back together.
+"""
+import io
+import wave
+
+# -------------------------------------
+# Long-audio segmentation
+# -------------------------------------
+# Formats that can be split locally on frame boundaries
+SEGMENTABLE_EXTENSIONS = ['.wav', '.mp3']
+
+# MPEG audio Layer III header tables
+MP3_BITRATES_KBPS = {
+    "mpeg1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "mpeg2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def segment_windows(duration, segment_seconds, overlap_seconds):
+    """
+    Compute overlapping (start, end) windows covering a recording
+
+    Args:
+        duration (float): Recording length in seconds
+        segment_seconds (float): Length of each segment
+        overlap_seconds (float): Overlap between consecutive segments
+
+    Returns:
+        list: (start, end) tuples in seconds
+    """
+    step = max(segment_seconds - overlap_seconds, 1)
+    windows = []
+    start = 0.0
+    while True:
+        end = min(start + segment_seconds, duration)
+        windows.append((start, end))
+        if end >= duration:
+            return windows
+        start += step
+
+def split_wav(data, segment_seconds, overlap_seconds):
+    """
+    Split a WAV file into overlapping WAV segments
+
+    Args:
+        data: Seekable file object with the WAV content
+        segment_seconds (float): Length of each segment
+        overlap_seconds (float): Overlap between consecutive segments
+
+    Yields:
+        bytes: Segment contents as WAV bytes, in order
+    """
+    data.seek(0)
+    with wave.open(data, "rb") as source:
+        params = source.getparams()
+        rate = source.getframerate()
+        for start, end in segment_windows(source.getnframes() / rate, segment_seconds, overlap_seconds):
+            source.setpos(int(start * rate))
+            frames = source.readframes(int((end - start) * rate))
+            buffer = io.BytesIO()
+            with wave.open(buffer, "wb") as target:
+                target.setparams(params)
+                target.writeframes(frames)
+            yield buffer.getvalue()
+
+def iter_mp3_frames(data):
+    """
+    Walk the MPEG Layer III frames of an MP3 file
+
+    Args:
+        data: MP3 file content as bytes or a memoryview
+
+    Yields:
+        tuple: (byte offset, frame length, frame duration in seconds)
+    """
+    position = 0
+    # Skip an ID3v2 tag (10-byte header + syncsafe size, optional 10-byte footer)
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        position = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    while position + 4 <= len(data):
+        b1, b2 = data[position + 1], data[position + 2]
+        version = (b1 >> 3) & 0x03  # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+        layer = (b1 >> 1) & 0x03    # 1 = Layer III
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x03
+        if (data[position] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or layer != 1
+                or bitrate_index in (0, 15) or rate_index == 3):
+            position += 1  # Not a frame header; resynchronize
+            continue
+
+        table = "mpeg1" if version == 3 else "mpeg2"
+        bitrate = MP3_BITRATES_KBPS[table][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        samples = 1152 if version == 3 else 576
+        length = (samples // 8) * bitrate // sample_rate + ((b2 >> 1) & 0x01)
+        yield position, length, samples / sample_rate
+        position += length
+
+def split_mp3(data, segment_seconds, overlap_seconds):
+    """
+    Split an MP3 file into overlapping segments on frame boundaries
+
+    Args:
+        data: MP3 file content as bytes or a memoryview
+        segment_seconds (float): Length of each segment
+        overlap_seconds (float): Overlap between consecutive segments
+
+    Yields:
+        bytes: Segment contents as MP3 bytes, in order
+    """
+    frames = []  # (start time, offset, length)
+    elapsed = 0.0
+    for offset, length, duration in iter_mp3_frames(data):
+        frames.append((elapsed, offset, length))
+        elapsed += duration
+    if not frames:
+        raise ValueError("No MP3 frames found")
+
+    for start, end in segment_windows(elapsed, segment_seconds, overlap_seconds):
+        selected = [(offset, length) for t, offset, length in frames if start <= t < end]
+        if selected:
+            first, last = selected[0], selected[-1]
+            yield bytes(data[first[0]:last[0] + last[1]])
+
+def split_audio(source, file_extension, segment_seconds, overlap_seconds):
+    """
+    Split a recording into overlapping segments in its own format
+
+    The recording is read in place (file object or buffer view) and segments are
+    produced one at a time, so only the segments not yet consumed are held in memory.
+
+    Args:
+        source: Seekable in-memory file object (e.g. Streamlit UploadedFile)
+        file_extension (str): One of SEGMENTABLE_EXTENSIONS
+        segment_seconds (float): Length of each segment
+        overlap_seconds (float): Overlap between consecutive segments
+
+    Yields:
+        bytes: Segment contents, in order
+    """
+    if file_extension == ".wav":
+        yield from split_wav(source, segment_seconds, overlap_seconds)
+    elif file_extension == ".mp3":
+        with source.getbuffer() as view:
+            yield from split_mp3(view, segment_seconds, overlap_seconds)
+    else:
+        raise ValueError(f"Cannot split {file_extension} files")
+
+def transcript_words(text):
+    """Lower-cased words with surrounding punctuation removed, for overlap matching"""
+    return [word.strip(".,!?;:\"'()").lower() for word in text.split()]
+
+def stitch_transcripts(texts, max_overlap_words):
+    """
+    Join segment transcripts, dropping words repeated in the overlap between segments
+
+    Args:
+        texts (list): Segment transcripts in order
+        max_overlap_words (int): Longest run of repeated words to look for
+
+    Returns:
+        str: Combined transcript
+    """
+    stitched = []
+    for text in texts:
+        words = text.split()
+        if stitched:
+            previous = transcript_words(" ".join(stitched[-max_overlap_words:]))
+            current = transcript_words(" ".join(words[:max_overlap_words]))
+            # Longest suffix of the previous text that is a prefix of this one
+            for size in range(min(len(previous), len(current)), 0, -1):
+                if previous[-size:] == current[:size]:
+                    words = words[size:]
+                    break
+        stitched.extend(words)
+    return " ".join(stitched)
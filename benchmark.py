@@ -0,0 +1,196 @@
+"""
+Offline benchmark of the app's own overhead
+
+Drives every page in page_names_to_funcs with Streamlit's AppTest against the
+local fake session (fake_session.py), so no Snowflake account is needed. For each
+page it measures the first render after switching to it and the following
+unchanged reruns:
+
+- script time (the app's own execution) and wall time (including AppTest overhead)
+- SQL calls issued
+- bytes uploaded to stages
+- peak Python memory allocated during the run
+
+Peak memory is measured in a second pass over the same runs, because tracing
+allocations slows the script down several times.
+
+Unchanged reruns should issue no queries; --max-rerun-queries turns that into a
+CI check that fails when a page starts querying on every rerun (e.g. on every
+keystroke).
+
+Usage:
+    python benchmark.py [--latency 0.05] [--reruns 2] [--max-rerun-queries 0] [--output bench_output.txt]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Configure the app before it is first executed
+os.environ.setdefault("GENAI_SESSION_PROVIDER", "fake_session:get_session")
+os.environ.setdefault("GENAI_CACHE_BACKEND", "none")
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import fake_session  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+class ScriptTimer:
+    """
+    Time spent executing the app script, excluding AppTest's polling between runs
+
+    Wraps Streamlit's script execution hook; when that is unavailable (other
+    Streamlit versions) script time is reported as None and wall time still applies.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.installed = False
+
+    def install(self):
+        try:
+            from streamlit.runtime.scriptrunner import script_runner
+            original = script_runner.exec_func_with_error_handling
+        except (ImportError, AttributeError):
+            return
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+
+        script_runner.exec_func_with_error_handling = timed
+        self.installed = True
+
+def measure(at, session, timer, run, trace_memory):
+    """
+    Execute one script run and collect its metrics
+
+    Args:
+        at (AppTest): App under test
+        session (FakeSession): Session the app is using
+        timer (ScriptTimer): Script execution timer
+        run (callable): Triggers the run (e.g. at.run)
+        trace_memory (bool): Whether tracemalloc is tracing this pass
+
+    Returns:
+        dict: script_seconds, wall_seconds, queries, bytes_uploaded, peak_mb, exceptions
+    """
+    session.reset_counters()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    timer.seconds = 0.0
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    return {
+        "script_seconds": timer.seconds if timer.installed else None,
+        "wall_seconds": elapsed,
+        "queries": len(session.queries),
+        "bytes_uploaded": session.bytes_uploaded,
+        "peak_mb": tracemalloc.get_traced_memory()[1] / 1024 / 1024 if trace_memory else None,
+        "exceptions": [e.message for e in at.exception],
+    }
+
+def run_pass(session, timer, reruns, timeout, trace_memory=False):
+    """
+    Render every page and its unchanged reruns with a fresh AppTest
+
+    Returns:
+        list: One result dict per (page, run)
+    """
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    results = [{"page": "(startup)", "run": "first", **measure(at, session, timer, at.run, trace_memory)}]
+    for page in list(at.sidebar.selectbox[0].options):
+        results.append({
+            "page": page, "run": "first",
+            **measure(at, session, timer, lambda: at.sidebar.selectbox[0].select(page).run(), trace_memory)
+        })
+        for index in range(reruns):
+            results.append({
+                "page": page, "run": f"rerun {index + 1}", **measure(at, session, timer, at.run, trace_memory)
+            })
+    return results
+
+def run_benchmark(latency=0.0, reruns=2, timeout=120):
+    """
+    Render every page and its unchanged reruns
+
+    Args:
+        latency (float): Simulated seconds per query
+        reruns (int): Unchanged reruns measured after each page's first render
+        timeout (float): Seconds allowed per script run
+
+    Returns:
+        list: One result dict per (page, run)
+    """
+    session = fake_session.get_session()
+    session.latency = latency
+    timer = ScriptTimer()
+    timer.install()
+
+    results = run_pass(session, timer, reruns, timeout)
+
+    # Same runs again with allocation tracing, for peak memory only
+    tracemalloc.start()
+    try:
+        memory = run_pass(session, timer, reruns, timeout, trace_memory=True)
+    finally:
+        tracemalloc.stop()
+    for result, traced in zip(results, memory):
+        result["peak_mb"] = traced["peak_mb"]
+    return results
+
+def format_results(results):
+    """Render results as a fixed-width table"""
+    header = (
+        f"{'Page':<28} {'Run':<8} {'Script (ms)':>11} {'Wall (ms)':>10} {'SQL':>5} "
+        f"{'Uploaded':>10} {'Peak MB':>8} {'Errors':>6}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        script = f"{r['script_seconds'] * 1000:.1f}" if r["script_seconds"] is not None else "n/a"
+        lines.append(
+            f"{r['page']:<28} {r['run']:<8} {script:>11} {r['wall_seconds'] * 1000:>10.1f} {r['queries']:>5} "
+            f"{r['bytes_uploaded']:>10,} {r['peak_mb']:>8.1f} {len(r['exceptions']):>6}"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page renders against the fake Snowpark session")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per query")
+    parser.add_argument("--reruns", type=int, default=2, help="Unchanged reruns measured per page")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed per script run")
+    parser.add_argument("--max-rerun-queries", type=int, default=None,
+                        help="Fail if any unchanged rerun issues more SQL calls than this")
+    parser.add_argument("--output", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.latency, args.reruns, args.timeout)
+    report = format_results(results)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+    failures = [r for r in results if r["exceptions"]]
+    if args.max_rerun_queries is not None:
+        failures += [
+            r for r in results
+            if r["run"].startswith("rerun") and r["queries"] > args.max_rerun_queries
+        ]
+    for r in failures:
+        print(
+            f"FAIL {r['page']} ({r['run']}): {r['queries']} SQL calls, {len(r['exceptions'])} exceptions",
+            file=sys.stderr
+        )
+        for message in r["exceptions"]:
+            print(f"    {message.splitlines()[0] if message else ''}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
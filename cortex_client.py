@@ -0,0 +1,1269 @@
+"""
+Cortex client layer for the GenAI Tools app
+
+Everything here works on a plain Snowpark session and has no Streamlit
+dependency, so it can be imported (and driven with the local fake session in
+fake_session.py) without running the app:
+
+    import cortex_client, fake_session
+    client = cortex_client.CortexClient(fake_session.get_session(), tracer=cortex_client.Tracer())
+    client.summarize("Some text")
+
+It holds the model registry, call tracing and metrics, the typed CortexClient,
+the response and semantic caches, latency-aware model routing and the
+background job queue. The app creates the shared instances (st.cache_resource)
+and renders their results.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------
+# Model registry
+# -------------------------------------
+# Per-model facts used for model pickers, cost estimates and auto routing:
+# context window (tokens), approximate credits per million tokens, prior throughput
+# (tokens per second, used until enough calls are recorded), the pages that offer
+# the model ("complete" and/or "image"), and the longest useful image edge
+ModelInfo = namedtuple(
+    "ModelInfo",
+    ["context_window", "credits_per_million_tokens", "prior_tokens_per_second", "uses", "max_image_dimension"],
+    defaults=(("complete",), None)
+)
+
+# Display order of the model pickers
+MODEL_REGISTRY = {
+    "claude-4-sonnet":   ModelInfo(200000, 2.55, 60, ("complete", "image"), 1568),
+    "claude-3-7-sonnet": ModelInfo(200000, 2.55, 60, ("complete", "image"), 1568),
+    "llama4-maverick":   ModelInfo(128000, 0.25, 120),
+    "llama4-scout":      ModelInfo(128000, 0.14, 150),
+    "deepseek-r1":       ModelInfo(32768, 1.03, 25),
+    "snowflake-arctic":  ModelInfo(4096, 0.84, 100),
+    "mistral-large":     ModelInfo(32000, 5.10, 50),
+    "mistral-large2":    ModelInfo(128000, 1.95, 60),
+    "mixtral-8x7b":      ModelInfo(32000, 0.22, 200),
+    "reka-flash":        ModelInfo(100000, 0.45, 120),
+    "reka-core":         ModelInfo(32000, 5.50, 40),
+    "llama3.1-405b":     ModelInfo(128000, 3.00, 30),
+    "llama3.2-1b":       ModelInfo(128000, 0.04, 400),
+    "llama3.2-3b":       ModelInfo(128000, 0.06, 300),
+    "mistral-7b":        ModelInfo(32000, 0.12, 250),
+    "pixtral-large":     ModelInfo(128000, 3.00, 60, ("image",), 1024),
+}
+
+def models_for(use):
+    """
+    Registry models offered for a use, in display order
+
+    Args:
+        use (str): "complete" or "image"
+
+    Returns:
+        list: Model names
+    """
+    return [model for model, info in MODEL_REGISTRY.items() if use in info.uses]
+
+# -------------------------------------
+# Call tracing and metrics
+# -------------------------------------
+# Most recent Cortex calls kept in memory for the Metrics page
+TRACE_BUFFER_SIZE = 2000
+# Input/output text kept per unflushed call for exact token counting at flush time
+TRACE_TEXT_CHARS = 16000
+# Total text kept across all unflushed calls; the oldest calls keep only estimated token counts beyond this
+TRACE_TEXT_BUDGET_CHARS = 2_000_000
+# Table receiving flushed call metrics
+METRICS_TABLE = "GENAI_CORTEX_METRICS"
+# Flush automatically once this many calls are unflushed (0 = only on demand)
+METRICS_FLUSH_EVERY = int(os.environ.get("GENAI_METRICS_FLUSH_EVERY", "0"))
+# Approximate credits per million tokens by model (from MODEL_REGISTRY) or task function; adjust to your rate card
+CREDITS_PER_MILLION_TOKENS = {
+    **{model: info.credits_per_million_tokens for model, info in MODEL_REGISTRY.items()},
+    "snowflake-arctic-embed-m-v1.5": 0.03,
+    "summarize": 0.10, "sentiment": 0.08, "translate": 1.50,
+}
+# Task functions COUNT_TOKENS accepts by name; completions are counted with their model
+TOKEN_COUNT_FUNCTIONS = {"summarize", "sentiment", "translate"}
+TOKEN_COUNT_MODEL_FUNCTIONS = {"complete", "complete_stream", "ai_complete_file"}
+
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token) used until exact counts exist"""
+    return -(-len(text or "") // 4)
+
+def token_count_target(record):
+    """
+    Model or function name COUNT_TOKENS should use for a traced call
+
+    Returns:
+        str: Target name, or None when the call's tokens cannot be counted
+    """
+    if record["function"] in TOKEN_COUNT_FUNCTIONS:
+        return record["function"]
+    if record["function"] in TOKEN_COUNT_MODEL_FUNCTIONS and record["model"]:
+        return record["model"]
+    return None
+
+def estimate_credits(record):
+    """Estimated credits for a traced call from its token counts"""
+    rate = CREDITS_PER_MILLION_TOKENS.get(record["model"] or record["function"])
+    if rate is None:
+        return None
+    return (record["input_tokens"] + record["output_tokens"]) * rate / 1_000_000
+
+class Tracer:
+    """Ring buffer of per-call latency, query ID, token and cost records"""
+
+    def __init__(self, size=TRACE_BUFFER_SIZE, text_budget=TRACE_TEXT_BUDGET_CHARS):
+        self.records = deque(maxlen=size)
+        self.text_budget = text_budget
+        self.text_chars = 0  # Characters of input/output text currently held
+        self.uncountable = set()  # COUNT_TOKENS targets that failed; their records keep estimates
+        self._lock = threading.Lock()
+
+    def _drop_texts(self, record):
+        """Release a record's texts (caller holds the lock)"""
+        self.text_chars -= len(record["input_text"]) + len(record["output_text"])
+        record["input_text"] = record["output_text"] = ""
+
+    def record(self, function, model, latency_s, page=None, query_id=None,
+               input_text="", output_text="", error=None, timed_out=False):
+        """
+        Add one call record to the buffer
+
+        Args:
+            function (str): Cortex function, e.g. "complete"
+            model (str): Model name, or None
+            latency_s (float): Wall time in seconds
+            page (str): Page that made the call
+            query_id (str): Snowflake query ID, when known
+            input_text (str): Call input, kept (truncated) until flushed or over the text budget
+            output_text (str): Call output, kept (truncated) until flushed or over the text budget
+            error (str): Error message for failed calls
+            timed_out (bool): The call was cancelled for taking too long (latency is a lower bound)
+        """
+        record = {
+            "recorded_at": datetime.now(),
+            "page": page,
+            "function": function,
+            "model": model,
+            "latency_s": latency_s,
+            "query_id": query_id,
+            "input_tokens": estimate_tokens(input_text),
+            "output_tokens": estimate_tokens(output_text),
+            "tokens_exact": False,
+            "error": error,
+            "timed_out": timed_out,
+            "flushed": False,
+            "input_text": (input_text or "")[:TRACE_TEXT_CHARS],
+            "output_text": (output_text or "")[:TRACE_TEXT_CHARS],
+        }
+        record["estimated_credits"] = estimate_credits(record)
+        with self._lock:
+            if len(self.records) == self.records.maxlen:
+                self._drop_texts(self.records[0])
+            self.records.append(record)
+            self.text_chars += len(record["input_text"]) + len(record["output_text"])
+            # Oldest calls give up their texts first and keep estimated token counts
+            for old in self.records:
+                if self.text_chars <= self.text_budget:
+                    break
+                self._drop_texts(old)
+
+    @contextmanager
+    def span(self, session, function, model=None, input_text="", page=None):
+        """
+        Time the enclosed Cortex call and record it
+
+        The block may set span["output_text"]. The Snowflake query ID is taken from
+        the session's query history when the session provides one. The history sees
+        every thread's queries, so only those issued by this thread are considered.
+        """
+        span = {"output_text": ""}
+        history = (
+            session.query_history(include_thread_id=True) if hasattr(session, "query_history") else nullcontext()
+        )
+        thread_id = threading.get_ident()
+        start = time.perf_counter()
+        error = None
+        timed_out = False
+        queries = None
+        try:
+            with history as queries:
+                yield span
+        except Exception as e:
+            error = str(e)
+            timed_out = isinstance(e, TimeoutError)
+            raise
+        finally:
+            query_id = None
+            if queries is not None:
+                own = [q for q in queries.queries if q.thread_id == thread_id]
+                query_id = own[-1].query_id if own else None
+            self.record(
+                function, model, time.perf_counter() - start, page=page, query_id=query_id,
+                input_text=input_text, output_text=span["output_text"], error=error, timed_out=timed_out
+            )
+
+    def snapshot(self):
+        """
+        Buffered records without their texts
+
+        Returns:
+            pd.DataFrame: One row per call
+        """
+        with self._lock:
+            rows = [{k: v for k, v in r.items() if not k.endswith("_text")} for r in self.records]
+        return pd.DataFrame(rows)
+
+    @property
+    def unflushed(self):
+        with self._lock:
+            return sum(1 for r in self.records if not r["flushed"])
+
+    def flush(self, client):
+        """
+        Write unflushed records to METRICS_TABLE with exact token counts
+
+        Tokens are counted with COUNT_TOKENS in one query per model/function, and
+        all records are inserted with a single statement. COUNT_TOKENS only supports
+        some models; groups it rejects keep their estimates (tokens_exact false) and
+        their target is not tried again.
+
+        Args:
+            client (CortexClient): Client used for token counting and the insert
+
+        Returns:
+            int: Number of records written
+        """
+        with self._lock:
+            records = [r for r in self.records if not r["flushed"]]
+        if not records:
+            return 0
+
+        groups = {}
+        for record in records:
+            target = token_count_target(record)
+            # Calls whose texts were released over the text budget keep their estimates
+            if target and target not in self.uncountable and (record["input_text"] or record["output_text"]):
+                groups.setdefault(target, []).append(record)
+        for target, group in groups.items():
+            try:
+                counts = client.count_tokens_many(
+                    [r["input_text"] for r in group] + [r["output_text"] for r in group], target
+                )
+            except Exception:
+                self.uncountable.add(target)
+                continue
+            for record, input_tokens, output_tokens in zip(group, counts[:len(group)], counts[len(group):]):
+                record["input_tokens"], record["output_tokens"] = input_tokens, output_tokens
+                record["tokens_exact"] = True
+                record["estimated_credits"] = estimate_credits(record)
+
+        client.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (
+                RECORDED_AT TIMESTAMP_LTZ, PAGE STRING, FUNCTION STRING, MODEL STRING,
+                LATENCY_S FLOAT, QUERY_ID STRING, INPUT_TOKENS NUMBER, OUTPUT_TOKENS NUMBER,
+                TOKENS_EXACT BOOLEAN, ESTIMATED_CREDITS FLOAT, ERROR STRING
+            )
+        """).collect()
+        payload = [
+            {k: (v.isoformat() if isinstance(v, datetime) else v)
+             for k, v in r.items() if not k.endswith("_text") and k != "flushed"}
+            for r in records
+        ]
+        client.session.sql(
+            f"""insert into {METRICS_TABLE}
+                select value:recorded_at::timestamp_ltz, value:page::string, value:function::string,
+                       value:model::string, value:latency_s::float, value:query_id::string,
+                       value:input_tokens::number, value:output_tokens::number,
+                       value:tokens_exact::boolean, value:estimated_credits::float, value:error::string
+                from table(flatten(parse_json(?)))""",
+            params=[json.dumps(payload, default=str)]
+        ).collect()
+
+        with self._lock:
+            for record in records:
+                record["flushed"] = True
+                self._drop_texts(record)
+        return len(records)
+
+# -------------------------------------
+# Cortex client layer
+# -------------------------------------
+# Categories used by ai_classify on the Classify and Batch Analysis pages
+CLASSIFY_CATEGORIES = [
+    'Complete Refund', 'Exchange Tickets', 'Refund Fees',
+    'Discount Sale', 'Send a Nice Thank You E-mail'
+]
+
+# Embedding model for the semantic cache (embed_text_768)
+EMBED_MODEL = "snowflake-arctic-embed-m-v1.5"
+EMBED_DIMENSIONS = 768
+
+# Model names are inlined into statement text (one cached plan per model), so only allow safe ones
+MODEL_NAME_PATTERN = re.compile(r"^[A-Za-z0-9._-]+$")
+
+# A single Cortex expression: SQL text with ? placeholders, its bind values, a result converter,
+# and the function/model/input text recorded when the call is traced
+CortexCall = namedtuple(
+    "CortexCall", ["expression", "params", "convert", "function", "model", "text"],
+    defaults=(None, None, "")
+)
+
+def sql_string_literal(value):
+    """
+    Quote a constant as a SQL string literal
+
+    Args:
+        value (str): Constant to quote
+
+    Returns:
+        str: Single-quoted literal with quotes and backslashes escaped
+    """
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def parse_variant(value):
+    """
+    Convert a VARIANT/OBJECT value returned by collect() into Python objects
+
+    Args:
+        value: JSON text (or already-parsed value) from a result row
+
+    Returns:
+        dict, list or scalar
+    """
+    return json.loads(value) if isinstance(value, str) else value
+
+def build_prompt(instruction, data):
+    """
+    Build the instruction-wrapped prompt used by the complete()-based pages
+
+    Args:
+        instruction (str): Model instructions
+        data (str): Pasted data or transcript
+
+    Returns:
+        str: Prompt in [INST] ... [/INST] format
+    """
+    return f"[INST]{instruction}{data}[/INST]"
+
+# Marker passed as the text of a call to reference the single input bound by batch_over()
+SHARED_INPUT = object()
+
+class CortexClient:
+    """Typed access to Snowflake Cortex functions using bind parameters and scalar fetches"""
+
+    def __init__(self, session, tracer=None):
+        self.session = session
+        self.tracer = tracer
+        self.page = None  # Page making calls in this script run, recorded in traces
+
+    def traced(self, function, model=None, text=""):
+        """
+        Span recording the enclosed call, or a no-op when tracing is off
+
+        Args:
+            function (str): Cortex function name
+            model (str): Model name, or None
+            text (str): Input text, used for token counts
+        """
+        if self.tracer is None or function is None:
+            return nullcontext({})
+        return self.tracer.span(self.session, function, model, text, page=self.page)
+
+    @staticmethod
+    def input_text(text):
+        """Input text for tracing ("" for the shared input of batch_over())"""
+        return "" if text is SHARED_INPUT else text
+
+    @staticmethod
+    def model_literal(model):
+        """Validate a model name and return it as a SQL literal"""
+        if not MODEL_NAME_PATTERN.match(model):
+            raise ValueError(f"Invalid model name: {model!r}")
+        return sql_string_literal(model)
+
+    @staticmethod
+    def text_arg(text):
+        """
+        SQL argument and bind values for a text input
+
+        Args:
+            text (str): Literal text to bind, or SHARED_INPUT to reference the input of batch_over()
+
+        Returns:
+            tuple: (SQL argument, list of bind values)
+        """
+        if text is SHARED_INPUT:
+            return "SRC.INPUT_TEXT", []
+        return "?", [text]
+
+    # -- Expression builders (usable on their own or combined with batch()/batch_over()) --
+
+    def translate_call(self, text, from_code, to_code):
+        arg, params = self.text_arg(text)
+        return CortexCall(
+            f"snowflake.cortex.translate({arg}, ?, ?)", params + [from_code, to_code], str,
+            "translate", None, self.input_text(text)
+        )
+
+    def sentiment_call(self, text):
+        arg, params = self.text_arg(text)
+        return CortexCall(f"snowflake.cortex.sentiment({arg})", params, float, "sentiment", None, self.input_text(text))
+
+    def summarize_call(self, text):
+        arg, params = self.text_arg(text)
+        return CortexCall(f"snowflake.cortex.summarize({arg})", params, str, "summarize", None, self.input_text(text))
+
+    def classify_call(self, text, categories=None):
+        arg, params = self.text_arg(text)
+        categories = ", ".join(sql_string_literal(c) for c in (categories or CLASSIFY_CATEGORIES))
+        return CortexCall(
+            f"snowflake.cortex.ai_classify({arg}, [{categories}])", params, parse_variant,
+            "ai_classify", None, self.input_text(text)
+        )
+
+    def complete_call(self, model, prompt):
+        arg, params = self.text_arg(prompt)
+        return CortexCall(
+            f"snowflake.cortex.complete({self.model_literal(model)}, {arg})", params, str,
+            "complete", model, self.input_text(prompt)
+        )
+
+    def instructed_complete_call(self, model, instruction, data):
+        """Completion of build_prompt(instruction, data) without re-binding the data"""
+        arg, params = self.text_arg(data)
+        return CortexCall(
+            f"snowflake.cortex.complete({self.model_literal(model)}, concat(?, {arg}, ?))",
+            [f"[INST]{instruction}"] + params + ["[/INST]"], str,
+            "complete", model, build_prompt(instruction, self.input_text(data))
+        )
+
+    def ai_complete_file_call(self, model, prompt, stage_name, file_path):
+        return CortexCall(
+            f"snowflake.cortex.ai_complete({self.model_literal(model)}, ?, TO_FILE(?, ?))",
+            [prompt, stage_name, file_path], str,
+            "ai_complete_file", model, prompt
+        )
+
+    def embed_call(self, text, model=EMBED_MODEL):
+        arg, params = self.text_arg(text)
+        return CortexCall(
+            f"snowflake.cortex.embed_text_768({self.model_literal(model)}, {arg})::ARRAY", params,
+            parse_variant, "embed_text_768", model, self.input_text(text)
+        )
+
+    def transcribe_call(self, stage_name, file_path):
+        return CortexCall(
+            "AI_TRANSCRIBE(TO_FILE(?, ?))", [stage_name, file_path], parse_variant, "ai_transcribe"
+        )
+
+    # -- Execution --
+
+    def run(self, call):
+        """
+        Execute one Cortex expression and return its scalar result
+
+        Args:
+            call (CortexCall): Expression to run
+
+        Returns:
+            Converted scalar result
+        """
+        with self.traced(call.function, call.model, call.text) as span:
+            row = self.session.sql(f"select {call.expression} as RESPONSE", params=call.params).collect()[0]
+            result = call.convert(row[0])
+            span["output_text"] = result if isinstance(result, str) else json.dumps(result, default=str)
+        return result
+
+    def run_with_timeout(self, call, timeout, poll_seconds=0.25):
+        """
+        Execute one Cortex expression as an async query, cancelling it after `timeout` seconds
+
+        Args:
+            call (CortexCall): Expression to run
+            timeout (float): Seconds to wait for the result
+            poll_seconds (float): Interval between completion checks
+
+        Returns:
+            Converted scalar result
+
+        Raises:
+            TimeoutError: The query did not finish in time (it is cancelled)
+        """
+        with self.traced(call.function, call.model, call.text) as span:
+            job = self.session.sql(f"select {call.expression} as RESPONSE", params=call.params).collect_nowait()
+            deadline = time.perf_counter() + timeout
+            while not job.is_done():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    job.cancel()
+                    raise TimeoutError(f"no answer within {timeout:.1f}s")
+                time.sleep(min(poll_seconds, remaining))
+            result = call.convert(job.result()[0][0])
+            span["output_text"] = result if isinstance(result, str) else json.dumps(result, default=str)
+        return result
+
+    def batch(self, **calls):
+        """
+        Execute several Cortex expressions as columns of a single statement
+
+        Args:
+            **calls: Column alias -> CortexCall
+
+        Returns:
+            dict: Column alias -> converted result
+        """
+        select_list = []
+        params = []
+        for alias, call in calls.items():
+            select_list.append(f"{call.expression} as {alias.upper()}")
+            params.extend(call.params)
+        with self.traced("batch", ", ".join(sorted({c.model for c in calls.values() if c.model}))):
+            row = self.session.sql("select " + ", ".join(select_list), params=params).collect()[0]
+        return {alias: call.convert(row[alias.upper()]) for alias, call in calls.items()}
+
+    def batch_over(self, text, **calls):
+        """
+        Execute several Cortex expressions over one bound input in a single statement
+
+        Calls built with SHARED_INPUT as their text reference the input instead of
+        binding their own copy, so the text is sent once however many columns use it.
+
+        Args:
+            text (str): Input text, bound once
+            **calls: Column alias -> CortexCall
+
+        Returns:
+            dict: Column alias -> converted result
+        """
+        select_list = []
+        params = []
+        for alias, call in calls.items():
+            select_list.append(f"{call.expression} as {alias.upper()}")
+            params.extend(call.params)
+        with self.traced("batch", ", ".join(sorted({c.model for c in calls.values() if c.model})), text):
+            row = self.session.sql(
+                "select " + ", ".join(select_list) + " from (select ? as INPUT_TEXT) SRC",
+                params=params + [text]
+            ).collect()[0]
+        return {alias: call.convert(row[alias.upper()]) for alias, call in calls.items()}
+
+    # -- Typed convenience methods --
+
+    def translate(self, text, from_code, to_code):
+        """Translate text between two language codes"""
+        return self.run(self.translate_call(text, from_code, to_code))
+
+    def sentiment(self, text):
+        """Sentiment score between -1 (negative) and 1 (positive)"""
+        return self.run(self.sentiment_call(text))
+
+    def summarize(self, text):
+        """Summary of the text"""
+        return self.run(self.summarize_call(text))
+
+    def classify(self, text, categories=None):
+        """ai_classify result object (with a "labels" list) for the given categories"""
+        return self.run(self.classify_call(text, categories))
+
+    def complete(self, model, prompt):
+        """Completion of the prompt by the given model"""
+        return self.run(self.complete_call(model, prompt))
+
+    def ai_complete_file(self, model, prompt, stage_name, file_path):
+        """Multimodal completion over a staged file"""
+        return self.run(self.ai_complete_file_call(model, prompt, stage_name, file_path))
+
+    def transcribe(self, stage_name, file_path):
+        """AI_TRANSCRIBE result object for a staged audio file"""
+        return self.run(self.transcribe_call(stage_name, file_path))
+
+    # -- Set-based execution over many inputs --
+
+    def run_many(self, expression, texts, convert=str, function=None):
+        """
+        Evaluate one expression over many texts in a single set-based query
+
+        Args:
+            expression (str): SQL expression with a {text} placeholder for each input
+            texts (list): Input texts, bound as one JSON array
+            convert (callable): Result converter
+            function (str): Function name to trace the query under (None = untraced)
+
+        Returns:
+            list: Converted results in input order
+        """
+        with self.traced(function, None, "\n".join(texts)):
+            rows = self.session.sql(
+                f"""select s.index as I, {expression.format(text="s.value::string")} as RESPONSE
+                    from table(flatten(parse_json(?))) s
+                    order by I""",
+                params=[json.dumps(texts)]
+            ).collect()
+        return [convert(row["RESPONSE"]) for row in rows]
+
+    def summarize_many(self, texts):
+        """Summaries of many texts, computed in one query"""
+        return self.run_many("snowflake.cortex.summarize({text})", texts, function="summarize")
+
+    def count_tokens_many(self, texts, model_or_function="summarize"):
+        """COUNT_TOKENS for many texts, computed in one query"""
+        return self.run_many(
+            f"snowflake.cortex.count_tokens({self.model_literal(model_or_function)}, {{text}})", texts, int
+        )
+# -------------------------------------
+# Response cache for Cortex calls
+# -------------------------------------
+# Entries older than this are treated as misses in both cache tiers
+CACHE_TTL_SECONDS = 24 * 60 * 60
+# Size limits for the in-process LRU tier
+CACHE_MAX_ENTRIES = 1024
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Persistent tier: "auto" (Snowflake table in SiS, SQLite elsewhere), "snowflake", "sqlite" or "none"
+CACHE_BACKEND = os.environ.get("GENAI_CACHE_BACKEND", "auto")
+CACHE_TABLE = "GENAI_RESPONSE_CACHE"
+CACHE_SQLITE_PATH = os.environ.get(
+    "GENAI_CACHE_SQLITE_PATH",
+    os.path.join(tempfile.gettempdir(), "genai_response_cache.sqlite")
+)
+
+def running_in_sis():
+    """
+    Check whether the app is running inside Streamlit in Snowflake
+
+    Returns:
+        bool: True when the SiS-only _snowflake module is importable
+    """
+    try:
+        import _snowflake  # noqa: F401 - only available inside SiS
+        return True
+    except ImportError:
+        return False
+
+def normalize_text(text):
+    """
+    Normalize input text so that cosmetic differences share a cache entry
+
+    Args:
+        text (str): Raw text entered by the user
+
+    Returns:
+        str: Text with unified line endings and collapsed whitespace runs
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(" ".join(line.split()) for line in lines).strip()
+
+def text_fingerprint(text):
+    """
+    Hash normalized text
+
+    Args:
+        text (str): Raw text entered by the user
+
+    Returns:
+        str: Hex SHA-256 digest of the normalized text
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def cache_key(function, model, text, options=None):
+    """
+    Build the cache key for one Cortex call
+
+    Args:
+        function (str): Cortex function name, e.g. "translate"
+        model (str): Model name, or None for task-specific functions
+        text (str): Input text
+        options (dict): Any other arguments that change the response
+
+    Returns:
+        str: Hex SHA-256 digest identifying the call
+    """
+    payload = json.dumps(
+        [function, model, text_fingerprint(text), options or {}],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """In-process cache with TTL expiry and entry/byte based LRU eviction"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        # Mark as most recently used
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Store a value, evicting least recently used entries as needed"""
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.time() + self.ttl, size, value)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+class SnowflakeCacheStore:
+    """Persistent cache tier backed by a Snowflake table"""
+
+    def __init__(self, session, table=CACHE_TABLE, ttl=CACHE_TTL_SECONDS):
+        self.session = session
+        self.table = table
+        self.ttl = ttl
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                CACHE_KEY STRING PRIMARY KEY,
+                VALUE STRING,
+                CREATED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+            )
+        """).collect()
+
+    def get(self, key):
+        rows = self.session.sql(
+            f"select VALUE from {self.table} where CACHE_KEY = ? "
+            "and CREATED_AT >= dateadd(second, ?, current_timestamp())",
+            params=[key, -self.ttl]
+        ).collect()
+        return json.loads(rows[0]["VALUE"]) if rows else None
+
+    def put(self, key, value):
+        self.session.sql(
+            f"""merge into {self.table} t
+                using (select ? as CACHE_KEY, ? as VALUE) s on t.CACHE_KEY = s.CACHE_KEY
+                when matched then update set VALUE = s.VALUE, CREATED_AT = current_timestamp()
+                when not matched then insert (CACHE_KEY, VALUE) values (s.CACHE_KEY, s.VALUE)""",
+            params=[key, json.dumps(value, default=str)]
+        ).collect()
+
+    def clear(self):
+        self.session.sql(f"truncate table if exists {self.table}").collect()
+
+class SQLiteCacheStore:
+    """Persistent cache tier backed by a local SQLite file (used outside SiS)"""
+
+    def __init__(self, path=CACHE_SQLITE_PATH, ttl=CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(cache_key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT value FROM response_cache WHERE cache_key = ? AND created_at >= ?",
+            (key, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO response_cache (cache_key, value, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), time.time())
+        )
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM response_cache")
+        self.conn.commit()
+
+class ResponseCache:
+    """Two-tier cache (in-process LRU + optional persistent store) for Cortex responses"""
+
+    def __init__(self, store=None):
+        self.memory = LRUCache()
+        self.store = store
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, function, model, text, options, compute):
+        """
+        Return a cached response for the call, computing and storing it on a miss
+
+        Args:
+            function (str): Cortex function name
+            model (str): Model name, or None
+            text (str): Input text
+            options (dict): Other arguments that change the response
+            compute (callable): Zero-argument function that runs the Cortex call
+
+        Returns:
+            The (JSON-serializable) response
+        """
+        key = cache_key(function, model, text, options)
+        with self._lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory_hits += 1
+                return value
+
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except Exception:
+                value = None  # A broken persistent tier must never break the page
+            if value is not None:
+                with self._lock:
+                    self.persistent_hits += 1
+                    self.memory.put(key, value)
+                return value
+
+        value = compute()
+        with self._lock:
+            self.misses += 1
+            self.memory.put(key, value)
+        if self.store is not None:
+            try:
+                self.store.put(key, value)
+            except Exception:
+                pass
+        return value
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.persistent_hits
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            self.memory_hits = self.persistent_hits = self.misses = 0
+        if self.store is not None:
+            self.store.clear()
+
+# -------------------------------------
+# Semantic cache for completions
+# -------------------------------------
+# Answers reused when both the instruction and the data are at least this similar (cosine)
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("GENAI_SEMANTIC_THRESHOLD", "0.95"))
+# Entries kept per model namespace, least recently used evicted first
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+# Table holding cached answers and their embeddings across restarts
+SEMANTIC_CACHE_TABLE = "GENAI_SEMANTIC_CACHE"
+# Tokens the embedding model reads; the rest of longer data is truncated away
+EMBED_WINDOW_TOKENS = 512
+
+class SemanticCache:
+    """
+    Completion answers looked up by embedding similarity, one namespace per model
+
+    Instruction and data are embedded separately and an entry matches only when
+    both are similar enough, so a long shared document cannot hide a different
+    question. Data longer than the embedding window is only partly embedded, so
+    it must also match exactly by hash (see semantic_data_hash). Lookups are
+    brute-force cosine similarity over unit vectors in NumPy. New entries are
+    written to SEMANTIC_CACHE_TABLE when a session is given.
+    """
+
+    def __init__(self, session=None, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.session = session
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.namespaces = {}  # model -> OrderedDict(entry id -> entry dict)
+        self._matrices = {}   # model -> (entry ids, instruction matrix, data matrix, data-empty flags, data hashes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def unit(vector):
+        """Unit-length float32 copy of a vector (zeros for empty inputs)"""
+        if vector is None:
+            return np.zeros(EMBED_DIMENSIONS, dtype=np.float32)
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _add_entry(self, model, entry):
+        namespace = self.namespaces.setdefault(model, OrderedDict())
+        namespace[entry["id"]] = entry
+        while len(namespace) > self.max_entries:
+            namespace.popitem(last=False)
+        self._matrices.pop(model, None)
+
+    def _matrix(self, model):
+        if model not in self._matrices:
+            entries = list(self.namespaces.get(model, {}).values())
+            self._matrices[model] = (
+                [e["id"] for e in entries],
+                np.stack([e["instruction_vector"] for e in entries]),
+                np.stack([e["data_vector"] for e in entries]),
+                np.array([e["data_empty"] for e in entries]),
+                [e["data_hash"] for e in entries],
+            )
+        return self._matrices[model]
+
+    def lookup(self, model, instruction_vector, data_vector, data_hash=None):
+        """
+        Most similar cached answer for a model, if above the threshold
+
+        Args:
+            model (str): Model namespace
+            instruction_vector (list): Instruction embedding
+            data_vector (list): Data embedding, or None for empty data
+            data_hash (str): semantic_data_hash() of the data; entries must have the same value
+
+        Returns:
+            tuple: (response, similarity), or None on a miss
+        """
+        with self._lock:
+            if not self.namespaces.get(model):
+                self.misses += 1
+                return None
+            ids, instructions, datas, data_empty, data_hashes = self._matrix(model)
+            instruction_scores = instructions @ self.unit(instruction_vector)
+            if data_vector is None:
+                data_scores = data_empty.astype(np.float32)
+            else:
+                data_scores = np.where(data_empty, 0.0, datas @ self.unit(data_vector))
+            # Truncated embeddings only say the data starts alike; long data must be identical
+            data_scores = np.where([h == data_hash for h in data_hashes], data_scores, 0.0)
+            # An entry is only as similar as its less similar half
+            scores = np.minimum(instruction_scores, data_scores)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.namespaces[model].move_to_end(ids[best])
+            self.hits += 1
+            return self.namespaces[model][ids[best]]["response"], float(scores[best])
+
+    def add(self, model, instruction_vector, data_vector, response, data_hash=None):
+        """
+        Cache an answer in memory and in SEMANTIC_CACHE_TABLE
+
+        Args:
+            model (str): Model namespace
+            instruction_vector (list): Instruction embedding
+            data_vector (list): Data embedding, or None for empty data
+            response (str): Model answer
+            data_hash (str): semantic_data_hash() of the data
+        """
+        entry = {
+            "id": uuid.uuid4().hex,
+            "instruction_vector": self.unit(instruction_vector),
+            "data_vector": self.unit(data_vector),
+            "data_empty": data_vector is None,
+            "data_hash": data_hash,
+            "response": response,
+        }
+        with self._lock:
+            self._add_entry(model, entry)
+        if self.session is not None:
+            self.session.sql(
+                f"""insert into {SEMANTIC_CACHE_TABLE} (ID, MODEL, INSTRUCTION_VECTOR, DATA_VECTOR, DATA_HASH, RESPONSE)
+                    select ?, ?, parse_json(?)::VECTOR(FLOAT, {EMBED_DIMENSIONS}),
+                           parse_json(?)::VECTOR(FLOAT, {EMBED_DIMENSIONS}), ?, ?""",
+                params=[
+                    entry["id"], model, json.dumps(entry["instruction_vector"].tolist()),
+                    None if data_vector is None else json.dumps(entry["data_vector"].tolist()),
+                    data_hash, response,
+                ]
+            ).collect()
+
+    def load(self):
+        """Create SEMANTIC_CACHE_TABLE if needed, trim it and load the newest entries per model"""
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {SEMANTIC_CACHE_TABLE} (
+                ID STRING,
+                MODEL STRING,
+                INSTRUCTION_VECTOR VECTOR(FLOAT, {EMBED_DIMENSIONS}),
+                DATA_VECTOR VECTOR(FLOAT, {EMBED_DIMENSIONS}),
+                DATA_HASH STRING,
+                RESPONSE STRING,
+                CREATED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+            )
+        """).collect()
+        # Tables created before DATA_HASH existed
+        self.session.sql(f"ALTER TABLE {SEMANTIC_CACHE_TABLE} ADD COLUMN IF NOT EXISTS DATA_HASH STRING").collect()
+        newest = f"""qualify row_number() over (partition by MODEL order by CREATED_AT desc) <= {int(self.max_entries)}"""
+        self.session.sql(
+            f"delete from {SEMANTIC_CACHE_TABLE} where ID not in (select ID from {SEMANTIC_CACHE_TABLE} {newest})"
+        ).collect()
+        rows = self.session.sql(f"""
+            select ID, MODEL, INSTRUCTION_VECTOR::ARRAY as INSTRUCTION_VECTOR,
+                   DATA_VECTOR::ARRAY as DATA_VECTOR, DATA_HASH, RESPONSE
+            from {SEMANTIC_CACHE_TABLE}
+            order by CREATED_AT
+        """).collect()
+        with self._lock:
+            for row in rows:
+                data_vector = parse_variant(row["DATA_VECTOR"]) if row["DATA_VECTOR"] is not None else None
+                self._add_entry(row["MODEL"], {
+                    "id": row["ID"],
+                    "instruction_vector": self.unit(parse_variant(row["INSTRUCTION_VECTOR"])),
+                    "data_vector": self.unit(data_vector),
+                    "data_empty": data_vector is None,
+                    "data_hash": row["DATA_HASH"],
+                    "response": row["RESPONSE"],
+                })
+
+def semantic_data_hash(data):
+    """
+    Exact-match key for data the embedding model cannot see in full
+
+    Half the window is used because the character-based estimate can undercount tokens.
+
+    Returns:
+        str: SHA-256 of the data when it exceeds the embedding window, otherwise None
+    """
+    if estimate_tokens(data) <= EMBED_WINDOW_TOKENS // 2:
+        return None
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+# -------------------------------------
+# Latency-aware model routing
+# -------------------------------------
+# Picker entry that lets the router choose the model
+AUTO_MODEL = "auto"
+# Latency quantile of recorded calls used for predictions (tail, not typical, latency)
+ROUTER_LATENCY_QUANTILE = 0.9
+# Recorded successful calls needed before a model's own history replaces its prior throughput
+ROUTER_MIN_SAMPLES = 3
+# Output length assumed for models without recorded calls
+ROUTER_DEFAULT_OUTPUT_TOKENS = 400
+# Each attempt may run this many times its predicted latency (at least ROUTER_MIN_ATTEMPT_S)
+# before it is cancelled, leaving the rest of the budget for fallbacks
+ROUTER_ATTEMPT_FACTOR = 2.0
+ROUTER_MIN_ATTEMPT_S = 1.0
+
+def recorded_model_stats(tracer):
+    """
+    Per-model throughput and output length from the traced completions
+
+    Calls cancelled for timing out count too: their latency is a lower bound, so
+    their seconds per token (with the expected output length) is used as a sample
+    and as a floor on the model's prediction. Other failed calls are ignored.
+
+    Args:
+        tracer (Tracer): Tracer holding the recorded calls
+
+    Returns:
+        dict: model -> {"seconds_per_token" (None below ROUTER_MIN_SAMPLES),
+            "floor_seconds_per_token" (None without timeouts), "output_tokens", "samples"}
+    """
+    calls = tracer.snapshot()
+    if calls.empty:
+        return {}
+    timed_out = calls["timed_out"].fillna(False).astype(bool) if "timed_out" in calls else False
+    calls = calls.assign(timed_out=timed_out)
+    calls = calls[
+        calls["function"].isin(TOKEN_COUNT_MODEL_FUNCTIONS) & calls["model"].notna()
+        & (calls["error"].isna() | calls["timed_out"])
+    ]
+    stats = {}
+    for model, group in calls.groupby("model"):
+        answered = group[~group["timed_out"]]
+        output_tokens = int(answered["output_tokens"].median()) if len(answered) else ROUTER_DEFAULT_OUTPUT_TOKENS
+        # Timed-out calls produced no output; assume the usual length
+        tokens = group["input_tokens"] + group["output_tokens"].where(~group["timed_out"], output_tokens)
+        seconds_per_token = group["latency_s"] / tokens.clip(lower=1)
+        stats[model] = {
+            "seconds_per_token": (
+                float(seconds_per_token.quantile(ROUTER_LATENCY_QUANTILE)) if len(group) >= ROUTER_MIN_SAMPLES else None
+            ),
+            "floor_seconds_per_token": (
+                float(seconds_per_token[group["timed_out"]].max()) if group["timed_out"].any() else None
+            ),
+            "output_tokens": output_tokens,
+            "samples": len(group),
+        }
+    return stats
+
+def route_models(prompt, budget_s, tracer):
+    """
+    Rank completion models for a prompt: cheapest within the latency budget first
+
+    Latency is predicted from the model's recorded tail seconds per token (or its
+    prior throughput, but never below what its timed-out calls showed) times the
+    prompt's estimated tokens plus the expected output.
+    Models whose context window cannot hold the prompt are excluded; models over the
+    budget follow the ones within it, fastest first, as fallbacks.
+
+    Args:
+        prompt (str): Full prompt text
+        budget_s (float): Latency budget in seconds
+        tracer (Tracer): Tracer whose recorded calls drive the predictions
+
+    Returns:
+        list: Candidate dicts (model, predicted_s, estimated_credits, fits_budget, source)
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    stats = recorded_model_stats(tracer)
+    candidates = []
+    for model in models_for("complete"):
+        info = MODEL_REGISTRY[model]
+        recorded = stats.get(model, {})
+        output_tokens = recorded.get("output_tokens", ROUTER_DEFAULT_OUTPUT_TOKENS)
+        if prompt_tokens + output_tokens > info.context_window:
+            continue
+        seconds_per_token = recorded.get("seconds_per_token") or 1 / info.prior_tokens_per_second
+        seconds_per_token = max(seconds_per_token, recorded.get("floor_seconds_per_token") or 0)
+        predicted = (prompt_tokens + output_tokens) * seconds_per_token
+        candidates.append({
+            "model": model,
+            "predicted_s": round(predicted, 2),
+            "estimated_credits": (prompt_tokens + output_tokens) * info.credits_per_million_tokens / 1_000_000,
+            "fits_budget": predicted <= budget_s,
+            "source": (
+                f"{recorded['samples']} recorded calls" if recorded.get("seconds_per_token")
+                else "prior + timeouts" if recorded.get("floor_seconds_per_token") else "prior"
+            ),
+        })
+    within = sorted((c for c in candidates if c["fits_budget"]), key=lambda c: c["estimated_credits"])
+    over = sorted((c for c in candidates if not c["fits_budget"]), key=lambda c: c["predicted_s"])
+    return within + over
+
+# -------------------------------------
+# Background jobs for long-running calls
+# -------------------------------------
+class JobQueue:
+    """
+    Cortex calls submitted as Snowpark async queries and collected later
+
+    Only query IDs and results are kept, so the queue can live in st.session_state
+    and jobs survive reruns and page switches. Works with any session exposing
+    sql().collect_nowait() and create_async_job(), including the local fake session.
+    """
+
+    def __init__(self, session, tracer=None):
+        self.session = session
+        self.tracer = tracer       # Records finished jobs as Cortex calls when set
+        self.jobs = OrderedDict()  # job id -> job record (dict)
+        self._handles = {}         # job id -> AsyncJob
+        self._converters = {}      # job id -> result converter
+        self._calls = {}           # job id -> CortexCall, for tracing
+
+    def submit(self, label, call, page=None):
+        """
+        Start a Cortex call without waiting for it
+
+        Args:
+            label (str): Description shown in the job list
+            call (CortexCall): Expression to run
+            page (str): Submitting page, recorded in traces
+
+        Returns:
+            dict: The new job record
+        """
+        handle = self.session.sql(f"select {call.expression} as RESPONSE", params=call.params).collect_nowait()
+        job_id = uuid.uuid4().hex[:8]
+        self.jobs[job_id] = {
+            "id": job_id,
+            "label": label,
+            "page": page,
+            "query_id": handle.query_id,
+            "status": "running",
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        self._handles[job_id] = handle
+        self._converters[job_id] = call.convert
+        self._calls[job_id] = call
+        return self.jobs[job_id]
+
+    def handle(self, job_id):
+        """Return the AsyncJob for a job, re-attaching by query ID if needed"""
+        if job_id not in self._handles:
+            self._handles[job_id] = self.session.create_async_job(self.jobs[job_id]["query_id"])
+        return self._handles[job_id]
+
+    def poll(self):
+        """
+        Collect results of finished jobs
+
+        Returns:
+            int: Number of jobs still running
+        """
+        running = 0
+        for job_id, job in self.jobs.items():
+            if job["status"] != "running":
+                continue
+            handle = self.handle(job_id)
+            if not handle.is_done():
+                running += 1
+                continue
+            try:
+                rows = handle.result()
+                job["result"] = self._converters.get(job_id, str)(rows[0][0])
+                job["status"] = "done"
+            except Exception as e:
+                job["error"] = str(e)
+                job["status"] = "failed"
+            job["finished_at"] = time.time()
+            self.trace(job_id)
+        return running
+
+    def trace(self, job_id):
+        """Record a finished job with the tracer (latency is submit-to-collect time)"""
+        call = self._calls.get(job_id)
+        if self.tracer is None or call is None or call.function is None:
+            return
+        job = self.jobs[job_id]
+        self.tracer.record(
+            call.function, call.model, job["finished_at"] - job["submitted_at"],
+            page=job.get("page"), query_id=job["query_id"], input_text=call.text,
+            output_text=job["result"] if isinstance(job["result"], str) else json.dumps(job["result"], default=str),
+            error=job["error"]
+        )
+
+    def cancel(self, job_id):
+        """Cancel a running job's query"""
+        job = self.jobs[job_id]
+        if job["status"] == "running":
+            self.handle(job_id).cancel()
+            job["status"] = "cancelled"
+            job["finished_at"] = time.time()
+
+    def remove(self, job_id):
+        """Forget a job (cancelling it if still running)"""
+        self.cancel(job_id)
+        self.jobs.pop(job_id)
+        self._handles.pop(job_id, None)
+        self._converters.pop(job_id, None)
+        self._calls.pop(job_id, None)
@@ -0,0 +1,298 @@
+"""
+Local stand-in for a Snowpark session
+
+Emulates the parts of the Snowpark API the app uses - session.sql(...).collect(),
+.to_pandas(), .collect_nowait(), create_async_job(), table(), write_pandas(),
+query_history() and session.file.put_stream()/get_stream() - with configurable
+query latency and canned Cortex responses, so the app's query logic (for example
+the background job queue) and its overhead can be exercised without a Snowflake
+account.
+
+Select statements answer with one column per alias in the select list, each taking
+the canned response of the first Cortex function found in its expression. Queries
+over table(flatten(parse_json(?))) return one row per element of the bound array.
+Uploaded files are kept in memory and listed by LIST, and stages created with
+CREATE STAGE are returned by SHOW STAGES.
+
+Run the app against it with:
+
+    GENAI_SESSION_PROVIDER=fake_session:get_session streamlit run streamlit_app.py
+"""
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import pandas as pd
+
+# Canned responses by Cortex function, matched case-insensitively against each selected expression
+DEFAULT_RESPONSES = {
+    "cortex.sentiment": 0.42,
+    "cortex.summarize": "Summary of the provided text.",
+    "cortex.translate": "Translated text.",
+    "cortex.ai_classify": '{"labels": ["Refund Fees"]}',
+    "cortex.count_tokens": 100,
+    "cortex.complete": "Generated response.",
+    "cortex.ai_complete": '{"Animal": "Dog", "Breed": "Labrador", "Environment": "Park"}',
+    "ai_transcribe": '{"audio_duration": 10.0, "text": "Transcribed audio."}',
+    "count(*)": 0,
+}
+
+# "<expression> as <ALIAS>" items of a select list
+ALIAS_PATTERN = re.compile(r"\bas\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+# Expressions that evaluate to the element index of a flattened input array
+INDEX_PATTERN = re.compile(r"\.index\b|value:i\b", re.IGNORECASE)
+
+# CREATE STAGE statements, capturing the stage name
+CREATE_STAGE_PATTERN = re.compile(r"^create\s+(?:or\s+replace\s+)?stage\s+(?:if\s+not\s+exists\s+)?([\w.$]+)", re.IGNORECASE)
+
+# Entry of query_history(), like snowflake.snowpark.QueryRecord
+QueryRecord = namedtuple("QueryRecord", ["query_id", "sql_text", "thread_id"])
+
+def stage_path(stage_location):
+    """Key for a staged file, e.g. @STAGE/dir/File.txt -> stage/dir/File.txt"""
+    stage, _, path = stage_location.lstrip("@").partition("/")
+    return f"{stage.lower()}/{path}"
+
+class FakeRow(dict):
+    """Result row supporting both column-name and positional access, like snowpark.Row"""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
+
+    def as_dict(self):
+        return dict(self)
+
+class FakeAsyncJob:
+    """Async query handle that completes after the session's latency has elapsed"""
+
+    def __init__(self, query_id, rows, latency):
+        self.query_id = query_id
+        self._rows = rows
+        self._done_at = time.monotonic() + latency
+        self._cancelled = False
+
+    def is_done(self):
+        return self._cancelled or time.monotonic() >= self._done_at
+
+    def result(self):
+        if self._cancelled:
+            raise RuntimeError(f"Query {self.query_id} was cancelled")
+        remaining = self._done_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        return self._rows
+
+    def cancel(self):
+        self._cancelled = True
+
+class FakeDataFrame:
+    """Lazily evaluated query result"""
+
+    def __init__(self, session, query, params):
+        self.session = session
+        self.query = query
+        self.params = params
+
+    def collect(self):
+        time.sleep(self.session.latency)
+        return self.session.respond(self.query, self.params)
+
+    def to_pandas(self):
+        return pd.DataFrame([row.as_dict() for row in self.collect()])
+
+    def collect_nowait(self):
+        job = FakeAsyncJob(
+            self.session.next_query_id(), self.session.respond(self.query, self.params), self.session.latency
+        )
+        self.session.jobs[job.query_id] = job
+        return job
+
+    def sort(self, *columns):
+        return self
+
+    def limit(self, n, offset=0):
+        return self
+
+class FakeQueryHistory:
+    """Context manager collecting the queries issued while it is open"""
+
+    def __init__(self, session):
+        self.session = session
+        self.queries = []
+
+    def __enter__(self):
+        self.session.listeners.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.session.listeners.remove(self)
+
+class FakeFileOperation:
+    """session.file replacement keeping staged files in memory"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def put_stream(self, input_stream, stage_location, parallel=4, auto_compress=True,
+                   source_compression="AUTO_DETECT", overwrite=False):
+        time.sleep(self.session.latency)
+        # Like the Snowflake connector, measure the stream by seeking to its end and rewind it
+        input_stream.seek(0, os.SEEK_END)
+        input_stream.seek(0)
+        data = bytearray()
+        while True:
+            chunk = input_stream.read(1024 * 1024)
+            if not chunk:
+                break
+            data += chunk
+        path = stage_path(stage_location) + (".gz" if auto_compress else "")
+        with self.session._lock:
+            if overwrite or path not in self.session.files:
+                self.session.files[path] = bytes(data)
+            self.session.bytes_uploaded += len(data)
+        return {"source": os.path.basename(path), "target": os.path.basename(path), "status": "UPLOADED"}
+
+    def get_stream(self, stage_location, decompress=False):
+        time.sleep(self.session.latency)
+        path = stage_path(stage_location)
+        if path not in self.session.files:
+            raise FileNotFoundError(f"{stage_location} does not exist on the stage")
+        data = self.session.files[path]
+        with self.session._lock:
+            self.session.bytes_downloaded += len(data)
+        return io.BytesIO(data)
+
+class FakeSession:
+    """
+    Snowpark session replacement with simulated latency
+
+    Args:
+        latency (float): Seconds each query takes
+        responses (dict): Overrides for DEFAULT_RESPONSES; values may be callables
+            taking (query, params) and returning the response
+    """
+
+    def __init__(self, latency=0.0, responses=None):
+        self.latency = latency
+        self.responses = {**DEFAULT_RESPONSES, **(responses or {})}
+        self.queries = []       # (query, params) for every sql() call
+        self.jobs = {}          # query id -> FakeAsyncJob
+        self.files = {}         # "stage/path" (stage lower-cased, like LIST output) -> bytes
+        self.stages = set()     # upper-cased names of stages created in this session
+        self.listeners = []     # open FakeQueryHistory objects
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+        self.file = FakeFileOperation(self)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_query_id(self):
+        with self._lock:
+            return f"fake-{next(self._ids):06d}-{uuid.uuid4().hex[:8]}"
+
+    def sql(self, query, params=None):
+        record = QueryRecord(self.next_query_id(), query, threading.get_ident())
+        with self._lock:
+            self.queries.append((query, params))
+            for history in self.listeners:
+                history.queries.append(record)
+        return FakeDataFrame(self, query, params)
+
+    def table(self, name):
+        return self.sql(f"select * from {name}")
+
+    def write_pandas(self, df, table_name, **kwargs):
+        with self._lock:
+            self.queries.append((f"write_pandas {table_name}", [len(df)]))
+        time.sleep(self.latency)
+        return self.table(table_name)
+
+    def create_async_job(self, query_id):
+        return self.jobs[query_id]
+
+    def query_history(self, include_describe=False, include_thread_id=False):
+        return FakeQueryHistory(self)
+
+    def reset_counters(self):
+        """Clear recorded queries and byte counters (staged files are kept)"""
+        with self._lock:
+            self.queries.clear()
+            self.bytes_uploaded = self.bytes_downloaded = 0
+
+    def canned(self, expression, query, params):
+        """Canned response for a selected expression, or None"""
+        lowered = expression.lower()
+        for pattern, value in self.responses.items():
+            if pattern in lowered:
+                return value(query, params) if callable(value) else value
+        return None
+
+    def list_files(self, query):
+        """Rows for LIST @stage/prefix, named like Snowflake names them"""
+        prefix = stage_path(query.split(None, 1)[1].strip())
+        return [FakeRow(name=path, size=len(data)) for path, data in self.files.items() if path.startswith(prefix)]
+
+    def respond(self, query, params):
+        """Return the canned result rows for a query"""
+        lowered = query.lower().strip()
+        if lowered.startswith("list "):
+            return self.list_files(query)
+        if lowered.startswith("show stages"):
+            return [FakeRow(name=name) for name in sorted(self.stages)]
+        created = CREATE_STAGE_PATTERN.match(query.strip())
+        if created:
+            with self._lock:
+                self.stages.add(created.group(1).upper())
+            return []
+        if not lowered.startswith("select"):
+            return []
+
+        # Split the select list into (alias, expression) items
+        select_list = re.split(r"\sfrom\s", query.strip()[len("select"):], maxsplit=1, flags=re.IGNORECASE)[0]
+        columns, start = [], 0
+        for match in ALIAS_PATTERN.finditer(select_list):
+            columns.append((match.group(1).upper(), select_list[start:match.start()]))
+            start = match.end()
+        if not columns:
+            columns = [("RESPONSE", select_list)]
+
+        # Set-based queries return one row per element of the bound JSON array
+        count = 1
+        if "flatten(parse_json(?))" in lowered:
+            arrays = [json.loads(p) for p in params or [] if isinstance(p, str) and p.startswith("[")]
+            count = len(arrays[0]) if arrays else 0
+
+        values = {alias: self.canned(expression, query, params) for alias, expression in columns}
+        if count == 1 and all(value is None for value in values.values()):
+            return []
+        return [
+            FakeRow({alias: index if INDEX_PATTERN.search(expression) else values[alias]
+                     for alias, expression in columns})
+            for index in range(count)
+        ]
+
+# Session shared by every script run when used as the app's session provider
+_shared_session = None
+
+def get_session():
+    """
+    Session provider for the app (GENAI_SESSION_PROVIDER=fake_session:get_session)
+
+    One session is shared by all reruns so counters accumulate across them.
+    GENAI_FAKE_LATENCY sets the simulated per-query latency in seconds.
+
+    Returns:
+        FakeSession: The shared fake session
+    """
+    global _shared_session
+    if _shared_session is None:
+        _shared_session = FakeSession(latency=float(os.environ.get("GENAI_FAKE_LATENCY", "0")))
+    return _shared_session
@@ -0,0 +1,298 @@
+"""
+Stage metadata and streamed uploads for the GenAI Tools app
+
+Works on a plain Snowpark session without Streamlit, so it can be imported and
+exercised with the local fake session in fake_session.py. The app keeps one
+StageRegistry per browser session (st.session_state) and renders progress.
+"""
+import hashlib
+import io
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+# Read size when hashing or uploading file objects
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+# Concurrent PUTs for multi-file uploads; also bounds how many files are held in memory at once
+STAGE_UPLOAD_WORKERS = 4
+
+# -------------------------------------
+# Stage existence check and creation
+# -------------------------------------
+def normalize_stage_name(stage_name):
+    """
+    Normalize a stage name for registry lookups
+
+    Args:
+        stage_name (str): Stage name with or without the @ prefix
+
+    Returns:
+        str: Upper-cased name without the @ prefix (unquoted identifiers are case-insensitive)
+    """
+    return stage_name.lstrip("@").upper()
+
+class StageRegistry:
+    """Per-session cache of stage existence, properties and listed objects"""
+
+    def __init__(self, session):
+        self.session = session
+        self.stages = {}      # normalized name -> SHOW STAGES row as a dict
+        self.missing = set()  # normalized names known not to exist
+        self.objects = {}     # normalized name -> set of relative paths known to be on the stage
+        self.listed = {}      # normalized name -> path prefixes whose objects are all in self.objects
+        self.warmed = False
+
+    def warm(self):
+        """
+        Load every stage in the current schema with a single SHOW STAGES query
+
+        This covers GENAI_STAGE, GENAI_AUDIO_STAGE and images_stage (setup.sql) at once.
+        """
+        self.stages.clear()
+        self.missing.clear()
+        for row in self.session.sql("SHOW STAGES").collect():
+            properties = row.as_dict()
+            self.stages[properties["name"].upper()] = properties
+        self.warmed = True
+
+    def properties(self, stage_name):
+        """
+        Return cached stage properties, querying Snowflake only on a cold lookup
+
+        Args:
+            stage_name (str): Stage name with or without the @ prefix
+
+        Returns:
+            dict: Stage properties, or None if the stage does not exist
+        """
+        name = normalize_stage_name(stage_name)
+        if name in self.stages:
+            return self.stages[name]
+        if name in self.missing:
+            return None
+
+        if "." not in name:
+            # Unqualified names are covered by SHOW STAGES on the current schema
+            if not self.warmed:
+                self.warm()
+                return self.properties(stage_name)
+            self.missing.add(name)
+            return None
+
+        # Qualified names live outside the current schema
+        try:
+            rows = self.session.sql(f"DESC STAGE {name}").collect()
+            self.stages[name] = {"name": name, "properties": [row.as_dict() for row in rows]}
+            return self.stages[name]
+        except Exception:
+            self.missing.add(name)
+            return None
+
+    def exists(self, stage_name):
+        return self.properties(stage_name) is not None
+
+    def create(self, stage_name):
+        """Create the stage and record it in the registry"""
+        name = normalize_stage_name(stage_name)
+        self.session.sql(f"""
+            CREATE STAGE IF NOT EXISTS {name}
+            ENCRYPTION = (TYPE = 'SNOWFLAKE_SSE')
+        """).collect()
+        # Record it directly instead of re-running SHOW STAGES on the next rerun;
+        # properties not known yet (e.g. directory_enabled) are simply absent
+        self.stages[name] = {"name": name}
+        self.missing.discard(name)
+
+    def invalidate(self, stage_name=None):
+        """
+        Drop cached metadata so the next lookup queries Snowflake again
+
+        Args:
+            stage_name (str): Stage to forget, or None to forget all stages
+        """
+        if stage_name is None:
+            self.stages.clear()
+            self.missing.clear()
+            self.objects.clear()
+            self.listed.clear()
+            self.warmed = False
+            return
+        name = normalize_stage_name(stage_name)
+        self.stages.pop(name, None)
+        self.missing.discard(name)
+        self.objects.pop(name, None)
+        self.listed.pop(name, None)
+        if "." not in name:
+            self.warmed = False
+
+    def list_objects(self, stage_name, prefix=""):
+        """
+        Load every object under a stage prefix into the cached listing
+
+        One LIST covers the whole prefix; prefixes already listed (or under a listed
+        prefix) are answered from the cache until the registry is invalidated.
+
+        Args:
+            stage_name (str): Stage name with the @ prefix
+            prefix (str): Path prefix relative to the stage root, "" for the whole stage
+
+        Returns:
+            set: Relative paths known to be on the stage
+        """
+        name = normalize_stage_name(stage_name)
+        known = self.objects.setdefault(name, set())
+        listed = self.listed.setdefault(name, set())
+        if any(prefix.startswith(done) for done in listed):
+            return known
+
+        for row in self.session.sql(f"LIST {stage_name}/{prefix}").collect():
+            # LIST returns names prefixed with the lower-cased stage name
+            known.add(row["name"].split("/", 1)[1])
+        listed.add(prefix)
+        return known
+
+    def has_object(self, stage_name, file_path):
+        """
+        Check whether a file is already on a stage, using the cached listing
+
+        Only the file's own hash prefix is listed, so the check stays cheap on large stages.
+
+        Args:
+            stage_name (str): Stage name with the @ prefix
+            file_path (str): Path relative to the stage root
+
+        Returns:
+            bool: True if the object exists
+        """
+        if file_path in self.objects.get(normalize_stage_name(stage_name), ()):
+            return True
+        return file_path in self.list_objects(stage_name, file_path.rsplit("/", 1)[0] + "/")
+
+    def put_objects(self, stage_name, items, on_progress=None):
+        """
+        Upload many files on a small bounded pool, skipping those already on the stage
+
+        Items are consumed lazily: at most STAGE_UPLOAD_WORKERS uploads run at once, and
+        the next item is only produced once one of them has finished. Existence is
+        answered from the cached listing, so list the relevant prefix first
+        (list_objects). Worker threads only run put_stream; the registry and progress
+        are updated on the calling thread.
+
+        Args:
+            stage_name (str): Stage name with the @ prefix
+            items: Iterable of (path relative to the stage root, bytes or seekable file object)
+            on_progress (callable): Called with the number of items handled so far
+
+        Returns:
+            list: Paths of every item, in order
+        """
+        known = self.objects.setdefault(normalize_stage_name(stage_name), set())
+
+        def put(path, source):
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                source = io.BytesIO(source)
+            source.seek(0)
+            self.session.file.put_stream(source, f"{stage_name}/{path}", auto_compress=False, overwrite=True)
+            return path
+
+        paths = []
+        pending = set()
+
+        def finish(done):
+            for future in done:
+                known.add(future.result())
+            if on_progress is not None:
+                on_progress(len(paths) - len(pending))
+
+        with ThreadPoolExecutor(max_workers=STAGE_UPLOAD_WORKERS) as pool:
+            for path, source in items:
+                paths.append(path)
+                if path in known:
+                    continue
+                if len(pending) >= STAGE_UPLOAD_WORKERS:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    finish(done)
+                pending.add(pool.submit(put, path, source))
+            for future in as_completed(list(pending)):
+                pending.discard(future)
+                finish({future})
+        return paths
+
+# -------------------------------------
+# Streamed uploads
+# -------------------------------------
+def source_size(source):
+    """
+    Size of upload content without reading it
+
+    Args:
+        source: bytes or a seekable file object (e.g. Streamlit UploadedFile)
+
+    Returns:
+        int: Size in bytes
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    position = source.tell()
+    size = source.seek(0, io.SEEK_END)
+    source.seek(position)
+    return size
+
+def hash_content(source):
+    """SHA-256 of bytes or a file object, without copying the content (see content_hash in streamlit_app.py)"""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    elif hasattr(source, "getbuffer"):
+        with source.getbuffer() as view:
+            digest.update(view)
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+        source.seek(0)
+    return digest.hexdigest()
+
+class ProgressReader(io.RawIOBase):
+    """
+    Seekable read-only view of a file object that reports upload progress
+
+    Seeks are forwarded to the source because the connector measures the stream
+    with seek(0, SEEK_END) and rewinds it before reading. Progress follows the
+    read position and is reported about once per UPLOAD_CHUNK_BYTES.
+    """
+
+    def __init__(self, source, total, on_progress):
+        self.source = source
+        self.total = total
+        self.on_progress = on_progress
+        self.position = source.tell()
+        self.reported = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.position = self.source.seek(offset, whence)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.advance(len(data))
+        return data
+
+    def readinto(self, buffer):
+        count = self.source.readinto(buffer) or 0
+        self.advance(count)
+        return count
+
+    def advance(self, count):
+        self.position += count
+        if (self.reported is None or self.position >= self.total
+                or abs(self.position - self.reported) >= UPLOAD_CHUNK_BYTES):
+            self.reported = self.position
+            self.on_progress(min(self.position, self.total), self.total)
@@ -6,6 +6,11 @@ import json            # JSON data handling
 import os              # Operating system interface
 import io              # Input/output operations
 import time            # Time-related functions
+import uuid            # Unique names for per-session temporary tables
+import re              # Text splitting and stage name validation
+import importlib       # Pluggable session provider
+from collections import OrderedDict  # Per-session memo ordering
+from concurrent.futures import ThreadPoolExecutor, as_completed  # Concurrent model calls
 
 # Snowflake-specific imports
 from snowflake.snowpark.context import get_active_session  # Get active Snowflake session
@@ -14,8 +19,48 @@ from snowflake.snowpark import DataFrame                   # Snowpark DataFrame
 from datetime import datetime                              # Date and time handling
 from streamlit_extras.stylable_container import stylable_container  # Custom styled containers
 
+# App layers without Streamlit dependencies (importable and testable on their own):
+# Cortex client, tracing, caches, routing and jobs; stage metadata and uploads; long-audio splitting
+from cortex_client import (
+    AUTO_MODEL, CACHE_BACKEND, CLASSIFY_CATEGORIES, METRICS_FLUSH_EVERY, METRICS_TABLE, MODEL_REGISTRY,
+    ROUTER_ATTEMPT_FACTOR, ROUTER_MIN_ATTEMPT_S, SHARED_INPUT, TRACE_BUFFER_SIZE,
+    CortexClient, JobQueue, ResponseCache, SQLiteCacheStore, SemanticCache, SnowflakeCacheStore, Tracer,
+    build_prompt, cache_key, estimate_tokens, models_for, parse_variant, route_models, running_in_sis,
+    semantic_data_hash, sql_string_literal, text_fingerprint,
+)
+from stage_files import ProgressReader, StageRegistry, hash_content, normalize_stage_name, source_size
+from audio_segments import SEGMENTABLE_EXTENSIONS, split_audio, stitch_transcripts
+
+# Optional image preprocessing (Pillow); uploads are sent unchanged when unavailable
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# Streaming Cortex Complete (snowflake-ml-python); the SQL path is used when unavailable
+try:
+    from snowflake.cortex import complete as cortex_complete
+except ImportError:
+    cortex_complete = None
+
+# Session provider as "module:function" (e.g. fake_session:get_session for local runs and benchmarks);
+# empty uses the active Snowflake session
+SESSION_PROVIDER = os.environ.get("GENAI_SESSION_PROVIDER", "")
+
+def get_session():
+    """
+    Return the Snowpark session the app runs against
+
+    Returns:
+        Session: Active Snowflake session, or the configured provider's session
+    """
+    if not SESSION_PROVIDER:
+        return get_active_session()
+    module_name, _, function_name = SESSION_PROVIDER.partition(":")
+    return getattr(importlib.import_module(module_name), function_name or "get_session")()
+
 # Initialize Snowflake session - establishes connection to Snowflake
-session = get_active_session()
+session = get_session()
 
 # Configure Streamlit page layout to use full width
 st.set_page_config(layout="wide")
@@ -45,6 +90,138 @@ card_style = """
     }
 """
 
+# -------------------------------------
+# Shared tracer and Cortex client
+# -------------------------------------
+@st.cache_resource
+def get_tracer():
+    """
+    Create the process-wide call tracer once per Streamlit server
+
+    Returns:
+        Tracer: Shared tracer
+    """
+    return Tracer()
+
+# Shared client for all pages, tracing every call
+cortex = CortexClient(session, tracer=get_tracer())
+
+# -------------------------------------
+# Response cache for Cortex calls
+# -------------------------------------
+@st.cache_resource
+def get_response_cache():
+    """
+    Create the process-wide response cache once per Streamlit server
+
+    Returns:
+        ResponseCache: Cache with the persistent tier selected by CACHE_BACKEND
+    """
+    backend = CACHE_BACKEND
+    if backend == "auto":
+        backend = "snowflake" if running_in_sis() else "sqlite"
+
+    store = None
+    try:
+        if backend == "snowflake":
+            store = SnowflakeCacheStore(session)
+        elif backend == "sqlite":
+            store = SQLiteCacheStore()
+    except Exception as e:
+        st.sidebar.warning(f"Persistent cache disabled: {str(e)}")
+    return ResponseCache(store)
+
+def render_cache_stats():
+    """Show response cache hit/miss counters in the sidebar"""
+    cache = get_response_cache()
+    total = cache.hits + cache.misses
+    hit_rate = cache.hits / total if total else 0.0
+    st.sidebar.caption(
+        f"Response cache: {cache.hits} hits ({cache.persistent_hits} persistent) / "
+        f"{cache.misses} misses - {hit_rate:.0%} hit rate, {len(cache.memory)} in memory"
+    )
+    if st.sidebar.button("Clear response cache"):
+        cache.clear()
+
+# -------------------------------------
+# Rerun-safe execution of Cortex calls
+# -------------------------------------
+# Results kept per browser session so reruns never repeat a call with the same inputs
+SESSION_MEMO_MAX_ENTRIES = 64
+
+def session_memo():
+    """
+    Return this session's memo of Cortex results, keyed by input fingerprint
+
+    Returns:
+        OrderedDict: fingerprint -> response, oldest first
+    """
+    if "cortex_memo" not in st.session_state:
+        st.session_state["cortex_memo"] = OrderedDict()
+    return st.session_state["cortex_memo"]
+
+def remember(fingerprint, value):
+    """
+    Store a result in the session memo, dropping the oldest entries beyond the limit
+
+    Args:
+        fingerprint (str): Key from cache_key()
+        value: Response to keep
+    """
+    memo = session_memo()
+    memo[fingerprint] = value
+    memo.move_to_end(fingerprint)
+    while len(memo) > SESSION_MEMO_MAX_ENTRIES:
+        memo.popitem(last=False)
+
+def run_cortex(function, model, text, options, compute, persist=True):
+    """
+    Shared entry point for Cortex calls made by the page functions
+
+    Looks the call up in the session memo first, then (when persist is set) in the
+    shared response cache, and only runs compute() when both miss.
+
+    Args:
+        function (str): Cortex function name
+        model (str): Model name, or None for task-specific functions
+        text (str): Input text
+        options (dict): Other arguments that change the response
+        compute (callable): Zero-argument function that runs the Cortex call
+        persist (bool): Also use the shared response cache
+
+    Returns:
+        The response
+    """
+    fingerprint = cache_key(function, model, text, options)
+    memo = session_memo()
+    if fingerprint in memo:
+        memo.move_to_end(fingerprint)
+        return memo[fingerprint]
+
+    if persist:
+        value = get_response_cache().get_or_compute(function, model, text, options, compute)
+    else:
+        value = compute()
+    remember(fingerprint, value)
+    return value
+
+def submitted_request(form_key, submitted, **inputs):
+    """
+    Track the inputs of the last submitted form so results survive reruns
+
+    Args:
+        form_key (str): Unique name of the form
+        submitted (bool): Whether the form was submitted in this run
+        **inputs: Values of the form's widgets
+
+    Returns:
+        dict: Inputs of the most recent submission, or None if never submitted
+    """
+    state_key = f"{form_key}_request"
+    if submitted:
+        st.session_state[state_key] = inputs
+    return st.session_state.get(state_key)
+
 def toolsapp():
     """Display the welcome page with logos and header information"""
     with st.container():
@@ -70,310 +247,2007 @@ def toolsapp():
                      help="Tools for Every Day AI")
             st.subheader("Welcome to Your New Generative AI Tools App!")
 
-            # Add styled spacing
-            with stylable_container("Card1", css_styles=card_style):
-                st.write(" ")
+            # Add styled spacing
+            with stylable_container("Card2", css_styles=card_style):
+                st.write(" ")
+
+            # Display bear mascot image
+            st.image(svg_content2, width=500)
+
+# Dictionary of supported languages with their language codes
+SUPPORTED_LANGUAGES = {
+    "German": "de", "French": "fr", "Hindi": "hi", "Korean": "ko",
+    "Portuguese": "pt", "English": "en", "Italian": "it", "Russian": "ru",
+    "Swedish": "sv", "Spanish": "es", "Japanese": "ja", "Arabic": "ar",
+    "Polish": "pl"
+}
+
+# -------------------------------------
+# Multi-target translation with a translation memory
+# -------------------------------------
+# Translated segments keyed by source segment hash and language pair, shared across users
+TRANSLATION_MEMORY_TABLE = "GENAI_TRANSLATION_MEMORY"
+# Sentence ends and line breaks; the separators are kept so the layout survives translation
+SEGMENT_SEPARATOR_PATTERN = re.compile(r"((?<=[.!?])[ \t]+|\s*\n\s*)")
+
+def split_segments(text):
+    """
+    Split text into translatable segments and the separators between them
+
+    Returns:
+        tuple: (segments, separators) with len(separators) == len(segments) - 1
+    """
+    parts = SEGMENT_SEPARATOR_PATTERN.split(text)
+    return parts[0::2], parts[1::2]
+
+def join_segments(segments, separators):
+    """Inverse of split_segments()"""
+    return "".join(s + sep for s, sep in zip(segments, separators + [""]))
+
+def ensure_translation_memory_table():
+    """Create the translation memory once per session"""
+    if st.session_state.get("translation_memory_ready"):
+        return
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {TRANSLATION_MEMORY_TABLE} (
+            SOURCE_HASH STRING,
+            FROM_CODE STRING,
+            TO_CODE STRING,
+            SOURCE_TEXT STRING,
+            TRANSLATION STRING,
+            CREATED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+    st.session_state["translation_memory_ready"] = True
+
+def translate_many(text, from_code, to_codes):
+    """
+    Translate text into several languages, reusing the translation memory per segment
+
+    Unique segments are crossed with the target languages, and only pairs missing
+    from TRANSLATION_MEMORY_TABLE are sent to translate(), all in one INSERT. A
+    second query reads every needed pair back, and each language is reassembled
+    with the original separators.
+
+    Args:
+        text (str): Text to translate
+        from_code (str): Source language code ("" to auto-detect)
+        to_codes (list): Target language codes
+
+    Returns:
+        dict: "translations" (code -> text), "pairs" (segment x language pairs needed)
+            and "translated" (pairs sent to the model)
+    """
+    ensure_translation_memory_table()
+    segments, separators = split_segments(text)
+    unique = {text_fingerprint(s): s for s in segments if s.strip()}
+    targets = [code for code in dict.fromkeys(to_codes) if code != from_code]
+
+    translated = 0
+    memory = {}
+    if unique and targets:
+        pairs_sql = """
+            select s.key as SOURCE_HASH, s.value::string as SOURCE_TEXT, l.value::string as TO_CODE
+            from table(flatten(parse_json(?))) s, table(flatten(parse_json(?))) l"""
+        pair_params = [json.dumps(unique), json.dumps(targets)]
+
+        # Only segments the memory has not seen for this language pair reach the model
+        with cortex.traced("translate", None, "\n".join(unique.values())):
+            rows = session.sql(
+                f"""insert into {TRANSLATION_MEMORY_TABLE} (SOURCE_HASH, FROM_CODE, TO_CODE, SOURCE_TEXT, TRANSLATION)
+                    select p.SOURCE_HASH, ?, p.TO_CODE, p.SOURCE_TEXT,
+                           snowflake.cortex.translate(p.SOURCE_TEXT, ?, p.TO_CODE)
+                    from ({pairs_sql}) p
+                    where not exists (
+                        select 1 from {TRANSLATION_MEMORY_TABLE} m
+                        where m.SOURCE_HASH = p.SOURCE_HASH and m.FROM_CODE = ? and m.TO_CODE = p.TO_CODE
+                    )""",
+                params=[from_code, from_code] + pair_params + [from_code]
+            ).collect()
+        translated = rows[0][0] if rows else 0
+
+        for row in session.sql(
+            f"""select m.SOURCE_HASH, m.TO_CODE, m.TRANSLATION
+                from {TRANSLATION_MEMORY_TABLE} m
+                join ({pairs_sql}) p on m.SOURCE_HASH = p.SOURCE_HASH and m.TO_CODE = p.TO_CODE
+                where m.FROM_CODE = ?
+                qualify row_number() over (partition by m.SOURCE_HASH, m.TO_CODE order by m.CREATED_AT) = 1""",
+            params=pair_params + [from_code]
+        ).collect():
+            memory[(row["SOURCE_HASH"], row["TO_CODE"])] = row["TRANSLATION"]
+
+    translations = {}
+    for code in dict.fromkeys(to_codes):
+        translations[code] = join_segments(
+            [memory.get((text_fingerprint(s), code), s) if s.strip() else s for s in segments],
+            separators
+        )
+    return {
+        "translations": translations,
+        "pairs": len(unique) * len(targets),
+        "translated": translated,
+    }
+
+def translate():
+    """Translation functionality using Snowflake Cortex AI"""
+    with st.container():
+        # Display header with logo
+        svg_content = read_svg("Snowflake.svg")
+        st.image(svg_content, width=100)
+        st.header("Translate With Snowflake Cortex")
+
+        # Multi-target mode translates into several languages in one query
+        xlate_multi = st.toggle("Multiple target languages", key="xlate_multi")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("translate_form"):
+            # Create two columns for language selection
+            col1, col2 = st.columns(2)
+            with col1:
+                # Source language dropdown
+                from_language = st.selectbox(
+                    "From", dict(sorted(SUPPORTED_LANGUAGES.items()))
+                )
+            with col2:
+                if xlate_multi:
+                    # Target languages multiselect
+                    to_languages = st.multiselect(
+                        "To", dict(sorted(SUPPORTED_LANGUAGES.items())), default=["Spanish"]
+                    )
+                else:
+                    # Target language dropdown
+                    to_languages = [st.selectbox("To", dict(sorted(SUPPORTED_LANGUAGES.items())))]
+
+            # Text area for input text to translate
+            xlate_entered_text = st.text_area(
+                "Enter text",
+                label_visibility="hidden",
+                height=300,
+                placeholder="For example: call transcript",
+            )
+            xlate_submitted = st.form_submit_button("Translate")
+
+        request = submitted_request(
+            "translate", xlate_submitted and bool(xlate_entered_text) and bool(to_languages),
+            text=xlate_entered_text, multi=xlate_multi,
+            from_code=SUPPORTED_LANGUAGES[from_language],
+            to_codes=[SUPPORTED_LANGUAGES[language] for language in to_languages],
+        )
+
+        # Process translation of the last submitted text
+        if request and request["multi"]:
+            # Segments missing from the translation memory are translated into every target at once
+            try:
+                xlate_result = run_cortex(
+                    "translate_many", None, request["text"],
+                    {"from": request["from_code"], "to": request["to_codes"]},
+                    lambda: translate_many(request["text"], request["from_code"], request["to_codes"]),
+                    persist=False
+                )
+            except Exception as e:
+                st.error(f"Error occurred while translating: {str(e)}")
+                return
+            st.caption(
+                f"{xlate_result['pairs'] - xlate_result['translated']} of {xlate_result['pairs']} "
+                "segment translations came from the translation memory"
+            )
+            languages = {code: name for name, code in SUPPORTED_LANGUAGES.items()}
+            for tab, code in zip(st.tabs([languages[c] for c in request["to_codes"]]), request["to_codes"]):
+                with tab:
+                    st.write(xlate_result["translations"][code])
+        elif request:
+            # Call Snowflake Cortex translate function (memoized per text and language pair)
+            xlate_cortex_response = run_cortex(
+                "translate", None, request["text"], {"from": request["from_code"], "to": request["to_codes"][0]},
+                lambda: cortex.translate(request["text"], request["from_code"], request["to_codes"][0])
+            )
+            # Display translated text
+            st.write(xlate_cortex_response)
+
+def sentiment():
+    """Sentiment analysis functionality using Snowflake Cortex AI"""
+    with st.container():
+        st.header("Sentiment Analysis With Snowflake Cortex")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("sentiment_form"):
+            # Text area for entering transcript or text to analyze
+            sent_entered_transcript = st.text_area(
+                "Enter call transcript",
+                label_visibility="hidden",
+                height=400,
+                placeholder="Enter call transcript",
+            )
+            sent_submitted = st.form_submit_button("Analyze Sentiment")
+
+        request = submitted_request(
+            "sentiment", sent_submitted and bool(sent_entered_transcript),
+            text=sent_entered_transcript,
+        )
+
+        # Process sentiment analysis of the last submitted transcript
+        if request:
+            # Call Snowflake Cortex sentiment analysis function (memoized per transcript)
+            sent_score = run_cortex(
+                "sentiment", None, request["text"], None,
+                lambda: cortex.sentiment(request["text"])
+            )
+            sent_cortex_response = pd.DataFrame({"SENTIMENT": [sent_score]})
+
+            st.caption(
+                "Score is between -1 and 1; -1 = Most negative, 1 = Positive, 0 = Neutral"
+            )
+            # Display sentiment results in a dataframe
+            st.dataframe(sent_cortex_response, hide_index=True, width=100)
+
+# -------------------------------------
+# Map-reduce summarization
+# -------------------------------------
+# Token budget per summarize() call; inputs larger than this are summarized in chunks
+SUMMARY_CHUNK_TOKENS = 6000
+# Inputs shorter than this many characters cannot exceed the budget and skip token counting
+SUMMARY_DIRECT_CHARS = SUMMARY_CHUNK_TOKENS * 2
+# Safety bound on reduce levels
+SUMMARY_MAX_LEVELS = 5
+
+def split_sentences(text):
+    """Split a paragraph into sentences on terminal punctuation"""
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+def chunk_by_tokens(text, budget=SUMMARY_CHUNK_TOKENS):
+    """
+    Split text into chunks of at most `budget` tokens on paragraph, then sentence, boundaries
+
+    Token counts come from COUNT_TOKENS, evaluated for all pieces in one query per level
+    of splitting. A single sentence larger than the budget becomes a chunk of its own.
+
+    Args:
+        text (str): Text to split
+        budget (int): Maximum tokens per chunk
+
+    Returns:
+        list: Chunk texts, in order
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    pieces = []  # (text, tokens, separator used when joining)
+    for paragraph, tokens in zip(paragraphs, cortex.count_tokens_many(paragraphs)):
+        if tokens <= budget:
+            pieces.append((paragraph, tokens, "\n\n"))
+            continue
+        sentences = split_sentences(paragraph)
+        for sentence, sentence_tokens in zip(sentences, cortex.count_tokens_many(sentences)):
+            pieces.append((sentence, sentence_tokens, " "))
+
+    # Greedily pack pieces into chunks
+    chunks = []
+    current, current_tokens = "", 0
+    for piece, tokens, separator in pieces:
+        if current and current_tokens + tokens > budget:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current = current + separator + piece if current else piece
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def summarize_hierarchical(text, on_level=None):
+    """
+    Summarize text of any size by summarizing chunks and recursively reducing the partials
+
+    Each level summarizes all of its chunks in one set-based query.
+
+    Args:
+        text (str): Text to summarize
+        on_level (callable): Called with (level number, partial summaries) as each level completes
+
+    Returns:
+        dict: {"summary": final summary, "levels": list of partial summary lists}
+    """
+    levels = []
+    current = text
+    for level in range(1, SUMMARY_MAX_LEVELS + 1):
+        chunks = [current] if len(current) <= SUMMARY_DIRECT_CHARS else chunk_by_tokens(current)
+        partials = cortex.summarize_many(chunks)
+        if len(partials) == 1:
+            return {"summary": partials[0], "levels": levels}
+        levels.append(partials)
+        if on_level:
+            on_level(level, partials)
+        current = "\n\n".join(partials)
+    # Reduction did not converge within the level limit; summarize what is left directly
+    return {"summary": cortex.summarize(current), "levels": levels}
+
+def render_summary_levels(container, level, partials):
+    """Show one level of partial summaries inside an expander"""
+    with container.expander(f"Level {level}: {len(partials)} partial summaries"):
+        for index, partial in enumerate(partials, start=1):
+            st.caption(f"Part {index}")
+            st.write(partial)
+
+def supersum():
+    """Text summarization functionality using Snowflake Cortex AI"""
+    with st.container():
+        st.header("Summarize Data With Snowflake Cortex")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("summarize_form"):
+            # Text area for entering data to summarize
+            ssum_entered_text = st.text_area(
+                "Enter data to summarize",
+                label_visibility="hidden",
+                height=400,
+                placeholder="Enter data to summarize",
+            )
+            ssum_submitted = st.form_submit_button("Summarize")
+
+        request = submitted_request(
+            "summarize", ssum_submitted and bool(ssum_entered_text),
+            text=ssum_entered_text,
+        )
+
+        # Process summarization of the last submitted text
+        if request:
+            # Partial summaries are shown as each reduce level completes
+            levels_container = st.container()
+            streamed = []
+
+            def on_level(level, partials):
+                streamed.append(level)
+                render_summary_levels(levels_container, level, partials)
+
+            # Summarize large inputs chunk by chunk and reduce the partials (memoized per text)
+            ssum_result = run_cortex(
+                "summarize_hierarchical", None, request["text"], {"chunk_tokens": SUMMARY_CHUNK_TOKENS},
+                lambda: summarize_hierarchical(request["text"], on_level)
+            )
+            if not streamed:
+                for level, partials in enumerate(ssum_result["levels"], start=1):
+                    render_summary_levels(levels_container, level, partials)
+
+            # Display summarized results
+            st.caption("Summarized data:")
+            st.write(ssum_result["summary"])
+
+# -------------------------------------
+# Semantic cache for completions
+# -------------------------------------
+@st.cache_resource
+def get_semantic_cache():
+    """
+    Create the process-wide semantic cache once per Streamlit server
+
+    Entries are persisted unless GENAI_CACHE_BACKEND is "none".
+
+    Returns:
+        SemanticCache: Shared cache
+    """
+    if CACHE_BACKEND == "none":
+        return SemanticCache()
+    cache = SemanticCache(session)
+    try:
+        cache.load()
+    except Exception as e:
+        st.sidebar.warning(f"Semantic cache not persisted: {str(e)}")
+        cache.session = None
+    return cache
+
+def embed_prompt(instruction, data):
+    """
+    Embed instruction and data in one statement
+
+    Returns:
+        tuple: (instruction vector, data vector or None when data is empty)
+    """
+    calls = {"INSTRUCTION_VECTOR": cortex.embed_call(instruction)}
+    if data.strip():
+        calls["DATA_VECTOR"] = cortex.embed_call(data)
+    vectors = cortex.batch(**calls)
+    return vectors["INSTRUCTION_VECTOR"], vectors.get("DATA_VECTOR")
+
+# -------------------------------------
+# Streaming completions
+# -------------------------------------
+def complete_sql(model, prompt):
+    """
+    Run snowflake.cortex.complete through SQL and return the whole response
+
+    Args:
+        model (str): Foundational model name
+        prompt (str): Full prompt text
+
+    Returns:
+        str: Model response
+    """
+    return cortex.complete(model, prompt)
+
+def stream_complete(model, prompt):
+    """
+    Yield response text incrementally, falling back to the SQL path
+
+    The streaming Python API is used when installed; if it fails before producing
+    any output the SQL path is used instead and its response yielded in one piece.
+
+    Args:
+        model (str): Foundational model name
+        prompt (str): Full prompt text
+
+    Yields:
+        str: Response chunks
+    """
+    if cortex_complete is not None:
+        started = False
+        try:
+            # The streaming API bypasses CortexClient, so trace it here; the SQL fallback traces itself
+            with get_tracer().span(session, "complete_stream", model, prompt, page=cortex.page) as span:
+                chunks = []
+                for chunk in cortex_complete(model, prompt, session=session, stream=True):
+                    started = True
+                    chunks.append(chunk)
+                    yield chunk
+                span["output_text"] = "".join(chunks)
+            return
+        except Exception:
+            if started:
+                raise
+    yield complete_sql(model, prompt)
+
+def render_completion(model, instruction, data, stream=True, semantic=False, budget_s=None):
+    """
+    Run a completion and render it, recording time-to-first-token and total latency
+
+    Args:
+        model (str): Foundational model name, or AUTO_MODEL to let the router choose
+        instruction (str): Model instructions
+        data (str): Pasted data or transcript
+        stream (bool): Render tokens as they arrive instead of waiting for the full response
+        semantic (bool): Reuse a cached answer to a similar instruction over similar data
+        budget_s (float): Latency budget for AUTO_MODEL
+
+    Returns:
+        str: Full model response
+    """
+    if model == AUTO_MODEL:
+        return render_routed_completion(instruction, data, budget_s)
+
+    prompt = build_prompt(instruction, data)
+
+    # Reruns with the same inputs show the remembered response instead of calling Cortex again
+    fingerprint = cache_key("complete", model, prompt)
+    if fingerprint in session_memo():
+        response = session_memo()[fingerprint]
+        st.write(response)
+        st.caption("Reused response from this session")
+        return response
+
+    # An embedding lookup costs far less than a large-model generation
+    vectors = None
+    if semantic:
+        try:
+            vectors = embed_prompt(instruction, data)
+            hit = get_semantic_cache().lookup(model, *vectors, data_hash=semantic_data_hash(data))
+        except Exception as e:
+            st.caption(f"Semantic cache unavailable: {str(e)}")
+            hit = None
+        if hit:
+            response, similarity = hit
+            st.write(response)
+            st.caption(f":green-background[cached] Answer to a similar question ({similarity:.1%} similar)")
+            remember(fingerprint, response)
+            return response
+
+    timings = {}
+    start = time.perf_counter()
+
+    if stream:
+        def timed_chunks():
+            for chunk in stream_complete(model, prompt):
+                timings.setdefault("first_token", time.perf_counter() - start)
+                yield chunk
+        response = st.write_stream(timed_chunks())
+    else:
+        response = complete_sql(model, prompt)
+        timings["first_token"] = time.perf_counter() - start
+        st.write(response)
+
+    timings["total"] = time.perf_counter() - start
+    st.caption(
+        f"Time to first token: {timings.get('first_token', timings['total']):.2f}s | "
+        f"Total: {timings['total']:.2f}s"
+    )
+    remember(fingerprint, response)
+    if vectors is not None:
+        try:
+            get_semantic_cache().add(model, *vectors, response, data_hash=semantic_data_hash(data))
+        except Exception as e:
+            st.caption(f"Answer not added to the semantic cache: {str(e)}")
+    return response
+
+# Upper bound on models compared side by side (and concurrent Cortex calls)
+MAX_COMPARE_MODELS = 4
+
+def timed_complete(model, prompt):
+    """
+    Run a SQL completion and measure its latency (safe to call from worker threads)
+
+    Args:
+        model (str): Foundational model name
+        prompt (str): Full prompt text
+
+    Returns:
+        tuple: (response text, latency in seconds)
+    """
+    start = time.perf_counter()
+    response = complete_sql(model, prompt)
+    return response, time.perf_counter() - start
+
+def render_model_comparison(models, instruction, data):
+    """
+    Send the same prompt to several models concurrently and render answers as they complete
+
+    Args:
+        models (list): Foundational model names
+        instruction (str): Model instructions
+        data (str): Pasted data or transcript
+
+    Returns:
+        pd.DataFrame: Per-model latency and output length
+    """
+    prompt = build_prompt(instruction, data)
+
+    # One column per model, each with a placeholder filled when its answer arrives
+    placeholders = {}
+    for column, model in zip(st.columns(len(models)), models):
+        with column:
+            st.subheader(model)
+            placeholders[model] = st.empty()
+            placeholders[model].info("Waiting for response...")
+
+    results = []
+
+    def show(model, response, elapsed):
+        with placeholders[model].container():
+            latency = f"{elapsed:.2f}s" if elapsed is not None else "Reused from this session"
+            st.caption(f"{latency} | {len(response):,} characters, {len(response.split()):,} words")
+            st.write(response)
+        results.append({
+            "MODEL": model,
+            "LATENCY_S": round(elapsed, 2) if elapsed is not None else None,
+            "CHARACTERS": len(response),
+            "WORDS": len(response.split()),
+        })
+
+    # Answers remembered from earlier runs are shown without calling Cortex again
+    pending = []
+    for model in models:
+        remembered = session_memo().get(cache_key("complete", model, prompt))
+        if remembered is not None:
+            show(model, remembered, None)
+        else:
+            pending.append(model)
+
+    if pending:
+        # Worker threads only run queries; all rendering stays on the script thread
+        with ThreadPoolExecutor(max_workers=min(MAX_COMPARE_MODELS, len(pending))) as pool:
+            futures = {pool.submit(timed_complete, model, prompt): model for model in pending}
+            for future in as_completed(futures):
+                model = futures[future]
+                try:
+                    response, elapsed = future.result()
+                except Exception as e:
+                    placeholders[model].error(f"Error occurred while calling {model}: {str(e)}")
+                    continue
+                remember(cache_key("complete", model, prompt), response)
+                show(model, response, elapsed)
+
+    comparison = pd.DataFrame(results, columns=["MODEL", "LATENCY_S", "CHARACTERS", "WORDS"])
+    if results:
+        st.caption("Comparison:")
+        st.dataframe(comparison.sort_values("LATENCY_S"), hide_index=True)
+    return comparison
+
+# -------------------------------------
+# Latency-aware model routing
+# -------------------------------------
+def render_routed_completion(instruction, data, budget_s):
+    """
+    Answer with the router's first choice, falling back to the next on error or timeout
+
+    The latency budget covers all attempts together, and routing stops once it is
+    spent. Each attempt except the last is also capped at ROUTER_ATTEMPT_FACTOR times
+    its predicted latency, so a model that hangs leaves time for the fallbacks.
+
+    Args:
+        instruction (str): Model instructions
+        data (str): Pasted data or transcript
+        budget_s (float): Latency budget in seconds
+
+    Returns:
+        str: Model response, or None if every candidate failed
+    """
+    prompt = build_prompt(instruction, data)
+
+    # Reruns with the same inputs show the remembered answer instead of routing again
+    fingerprint = cache_key("complete", AUTO_MODEL, prompt, {"budget": budget_s})
+    if fingerprint in session_memo():
+        routed = session_memo()[fingerprint]
+        st.write(routed["response"])
+        st.caption(f"Reused response from this session (routed to {routed['model']})")
+        return routed["response"]
+
+    candidates = route_models(prompt, budget_s, get_tracer())
+    with st.expander("Routing"):
+        st.dataframe(pd.DataFrame(candidates), hide_index=True, use_container_width=True)
+    if not candidates:
+        st.error("No model has a context window large enough for this prompt.")
+        return None
+
+    # One deadline for the whole request, not one budget per attempt
+    deadline = time.perf_counter() + budget_s
+    for index, candidate in enumerate(candidates):
+        model = candidate["model"]
+        start = time.perf_counter()
+        remaining = deadline - start
+        if remaining <= 0:
+            break
+        timeout = remaining
+        if index < len(candidates) - 1:
+            timeout = min(remaining, max(candidate["predicted_s"] * ROUTER_ATTEMPT_FACTOR, ROUTER_MIN_ATTEMPT_S))
+        try:
+            with st.spinner(f"Asking {model}..."):
+                response = cortex.run_with_timeout(cortex.complete_call(model, prompt), timeout)
+        except Exception as e:
+            st.caption(f"{model} did not answer ({str(e)}); trying the next model")
+            continue
+        st.write(response)
+        st.caption(
+            f"Routed to {model}: predicted {candidate['predicted_s']:.1f}s, "
+            f"took {time.perf_counter() - start:.1f}s"
+        )
+        remember(fingerprint, {"model": model, "response": response})
+        return response
+
+    st.error("Every candidate model failed or exceeded the latency budget.")
+    return None
+
+def nextba():
+    """Next Best Action recommendation using Snowflake foundational LLMs"""
+    with st.container():
+        st.header("Use a Snowflake Foundational LLM to Identify Customer Next Best Action")
+
+        # Foundational models from the registry
+        model_list = models_for("complete")
+
+        # Compare mode sends the same prompt to several models at once
+        next_compare = st.toggle("Compare models", key="next_compare")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("nextba_form"):
+            if next_compare:
+                # Multi-model selection for side-by-side comparison
+                next_selected_models = st.multiselect(
+                    "Which Foundational Models:", model_list,
+                    default=model_list[:2], max_selections=MAX_COMPARE_MODELS
+                )
+            else:
+                # Model selection dropdown ("auto" lets the router pick within the latency budget)
+                next_selected_models = [
+                    st.selectbox("Which Foundational Model:", [AUTO_MODEL] + model_list, index=1)
+                ]
+
+            # Text area for input data
+            next_entered_code = st.text_area(
+                "Paste the Data for Your Question",
+                label_visibility="hidden",
+                height=300,
+                placeholder="Paste Data",
+            )
+
+            # Default instruction prompt for the model
+            next_default_model_instruct = """Based on these data, please provide the next best action"""
+
+            # Text area for custom model instructions
+            next_model_instruct = st.text_area(
+                "Please provide Model Instructions",
+                next_default_model_instruct,
+                label_visibility="hidden",
+                placeholder="Enter Prompt",
+            )
+
+            # Toggle for incremental token rendering (single-model mode only)
+            next_stream = st.toggle(
+                "Stream response", value=True, key="next_stream", disabled=next_compare
+            )
+
+            # Long generations can run as background jobs (single-model mode only)
+            next_background = st.toggle(
+                "Run in background", key="next_background", disabled=next_compare
+            )
+
+            # Reuse answers to near-identical questions over near-identical data (single-model mode only)
+            next_semantic = st.toggle(
+                "Use semantic cache", value=True, key="next_semantic", disabled=next_compare
+            )
+
+            # Latency budget the router must fit when "auto" is selected
+            next_budget = st.slider(
+                "Latency budget for auto (seconds)", min_value=1, max_value=120, value=15,
+                key="next_budget", disabled=next_compare
+            )
+
+            # Button to trigger next best action analysis
+            next_submitted = st.form_submit_button("Next Best Action!")
+
+        next_background = next_background and not next_compare
+        if next_submitted and next_background:
+            submit_completion_job(
+                "Next Best Action", next_selected_models[0], next_model_instruct, next_entered_code,
+                budget_s=next_budget
+            )
+
+        request = submitted_request(
+            "nextba", next_submitted and bool(next_selected_models) and not next_background,
+            compare=next_compare, models=next_selected_models,
+            instruction=next_model_instruct, data=next_entered_code, stream=next_stream,
+            semantic=next_semantic, budget=next_budget,
+        )
+
+        if request:
+            if request["compare"]:
+                # Fan the prompt out to every selected model concurrently
+                render_model_comparison(request["models"], request["instruction"], request["data"])
+            else:
+                st.caption("Answer:")
+                # Call Snowflake Cortex complete, streaming tokens when possible
+                render_completion(
+                    request["models"][0], request["instruction"], request["data"],
+                    stream=request["stream"], semantic=request["semantic"], budget_s=request["budget"]
+                )
+
+def classify():
+    """Text classification functionality using Snowflake Cortex AI"""
+    with st.container():
+        st.header("Classify Data With Snowflake Cortex")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("classify_form"):
+            # Text area for data to classify
+            class_entered_text = st.text_area(
+                "Enter data to Classify",
+                label_visibility="hidden",
+                height=400,
+                placeholder="Enter data to classify",
+            )
+            class_submitted = st.form_submit_button("Classify")
+
+        request = submitted_request(
+            "classify", class_submitted and bool(class_entered_text),
+            text=class_entered_text,
+        )
+
+        # Process classification of the last submitted text
+        if request:
+            # Call Snowflake Cortex ai_classify function with predefined categories (memoized per text)
+            class_cortex_response = run_cortex(
+                "ai_classify", None, request["text"], {"categories": CLASSIFY_CATEGORIES},
+                lambda: cortex.classify(request["text"])
+            )
+
+            # Display classification result
+            st.caption("Classified data:")
+            st.write(class_cortex_response)
+
+# Cortex functions available on the Batch Analysis page, mapped to the SQL expression over TRANSCRIPT
+BATCH_FUNCTIONS = {
+    "Sentiment": "snowflake.cortex.sentiment(TRANSCRIPT) as SENTIMENT",
+    "Classify": "snowflake.cortex.ai_classify(TRANSCRIPT, [{categories}]):labels[0]::string as CATEGORY",
+    "Summarize": "snowflake.cortex.summarize(TRANSCRIPT) as SUMMARY",
+}
+
+def read_batch_upload(uploaded_file):
+    """
+    Read an uploaded CSV or Parquet file into a pandas DataFrame
+
+    The parsed frame of the most recent upload is kept in session state by
+    UploadedFile.file_id, so reruns (e.g. paging through results) don't parse it again.
+
+    Args:
+        uploaded_file: Streamlit UploadedFile
+
+    Returns:
+        pd.DataFrame: File contents
+    """
+    cached = st.session_state.get("batch_upload")
+    if cached is not None and cached["file_id"] == uploaded_file.file_id:
+        return cached["df"]
+
+    uploaded_file.seek(0)
+    if os.path.splitext(uploaded_file.name)[1].lower() == ".parquet":
+        df = pd.read_parquet(uploaded_file)
+    else:
+        df = pd.read_csv(uploaded_file)
+    st.session_state["batch_upload"] = {"file_id": uploaded_file.file_id, "df": df}
+    return df
+
+def run_batch_cortex(df, text_column, functions):
+    """
+    Bulk-load transcripts into a temp table and score them with one set-based query
+
+    Args:
+        df (pd.DataFrame): Uploaded data
+        text_column (str): Column holding the transcript text
+        functions (list): Keys of BATCH_FUNCTIONS to compute
+
+    Returns:
+        str: Name of the temporary table holding the results
+    """
+    suffix = uuid.uuid4().hex[:8].upper()
+    input_table = f"GENAI_BATCH_INPUT_{suffix}"
+    results_table = f"GENAI_BATCH_RESULTS_{suffix}"
+
+    # Only ship the row number and text column to Snowflake
+    batch_df = pd.DataFrame({
+        "ROW_ID": range(len(df)),
+        "TRANSCRIPT": df[text_column].fillna("").astype(str).values,
+    })
+    session.write_pandas(
+        batch_df, input_table,
+        auto_create_table=True, table_type="temporary", overwrite=True
+    )
+
+    # One SELECT over the whole table so the warehouse parallelizes the Cortex calls
+    categories = ", ".join(sql_string_literal(c) for c in CLASSIFY_CATEGORIES)
+    select_list = ",\n".join(
+        BATCH_FUNCTIONS[f].format(categories=categories) for f in functions
+    )
+    with cortex.traced("batch_analysis"):
+        session.sql(f"""
+            create or replace temporary table {results_table} as
+            select ROW_ID, TRANSCRIPT,
+            {select_list}
+            from {input_table}
+        """).collect()
+    session.sql(f"drop table if exists {input_table}").collect()
+    return results_table
+
+def batchcortex():
+    """Set-based batch sentiment, classification and summarization over an uploaded file"""
+    with st.container():
+        st.header("Batch Analysis With Snowflake Cortex")
+        st.write("Upload a CSV or Parquet file of transcripts to score them all in a single query.")
+
+        # File uploader for the transcript file
+        uploaded_file = st.file_uploader("Choose a file", type=["csv", "parquet"])
+
+        if uploaded_file:
+            try:
+                batch_df = read_batch_upload(uploaded_file)
+            except Exception as e:
+                st.error(f"Error occurred while reading file: {str(e)}")
+                return
+
+            st.caption(f"{len(batch_df):,} rows loaded from '{uploaded_file.name}'")
+
+            # Column and function selection
+            text_column = st.selectbox("Transcript column:", list(batch_df.columns))
+            functions = st.multiselect(
+                "Cortex functions:", list(BATCH_FUNCTIONS), default=list(BATCH_FUNCTIONS)
+            )
+
+            # Button to run the batch query
+            if st.button("Run Batch", disabled=not functions):
+                with st.spinner("Running Cortex over the uploaded rows..."):
+                    try:
+                        st.session_state["batch_results_table"] = run_batch_cortex(
+                            batch_df, text_column, functions
+                        )
+                        st.session_state["batch_results_rows"] = len(batch_df)
+                    except Exception as e:
+                        st.error(f"Error occurred while running batch: {str(e)}")
+
+        # Page through the results table rather than materializing it all at once
+        results_table = st.session_state.get("batch_results_table")
+        if results_table:
+            total_rows = st.session_state.get("batch_results_rows", 0)
+            col1, col2 = st.columns(2)
+            with col1:
+                page_size = st.selectbox("Rows per page:", [25, 50, 100, 250])
+            page_count = max(1, -(-total_rows // page_size))
+            with col2:
+                page = st.number_input("Page:", min_value=1, max_value=page_count, value=1)
+
+            results_page = (
+                session.table(results_table)
+                .sort(col("ROW_ID"))
+                .limit(page_size, offset=(page - 1) * page_size)
+                .to_pandas()
+            )
+            st.caption(f"Page {page} of {page_count} ({total_rows:,} rows)")
+            st.dataframe(results_page, hide_index=True, use_container_width=True)
+
+def emailcomplete():
+    """Email generation functionality using Snowflake foundational LLMs"""
+    with st.container():
+        st.header("Generate a Customer E-Mail With Snowflake Cortex Complete")
+
+        # Foundational models from the registry
+        model_list = models_for("complete")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("email_form"):
+            # Model selection dropdown ("auto" lets the router pick within the latency budget)
+            email_selected_model = st.selectbox("Which Foundational Model:", [AUTO_MODEL] + model_list, index=1)
+
+            # Text area for call transcript input
+            email_entered_code = st.text_area(
+                "Paste the Call Transcript to use for E-Mail Generation:",
+                label_visibility="hidden",
+                height=300,
+                placeholder="Paste Call Transcript",
+            )
+
+            # Default email generation instructions
+            email_default_model_instruct = """Please create an email for me that describes the issue in detail and provides a solution. Make the e-mail from me, the Director of Customer Relations at The Big Ticket Co, and also give the customer a 10% discount with code: CS10OFF of a future order"""
+
+            # Text area for custom email instructions
+            email_model_instruct = st.text_area(
+                "Please Provide E-Mail Generation Model Instructions: ",
+                email_default_model_instruct,
+                label_visibility="hidden",
+                placeholder="Enter Prompt",
+            )
+
+            # Toggle for incremental token rendering
+            email_stream = st.toggle("Stream response", value=True, key="email_stream")
+
+            # Long generations can run as background jobs so the page stays usable
+            email_background = st.toggle("Run in background", key="email_background")
+
+            # Latency budget the router must fit when "auto" is selected
+            email_budget = st.slider(
+                "Latency budget for auto (seconds)", min_value=1, max_value=120, value=15,
+                key="email_budget"
+            )
+
+            # Button to trigger email generation
+            email_submitted = st.form_submit_button("Generate E-Mail")
+
+        if email_submitted and email_background:
+            submit_completion_job(
+                "E-Mail", email_selected_model, email_model_instruct, email_entered_code, budget_s=email_budget
+            )
+
+        request = submitted_request(
+            "email", email_submitted and not email_background,
+            model=email_selected_model, instruction=email_model_instruct,
+            data=email_entered_code, stream=email_stream, budget=email_budget,
+        )
+
+        if request:
+            st.caption("Customer E-Mail:")
+            # Call Snowflake Cortex complete, streaming tokens when possible
+            render_completion(
+                request["model"], request["instruction"], request["data"],
+                stream=request["stream"], budget_s=request["budget"]
+            )
+
+# -------------------------------------
+# Chat mode with bounded conversation memory
+# -------------------------------------
+# Recent messages sent verbatim; older ones are folded into the rolling summary
+CHAT_HISTORY_TOKENS = 2000
+# Most recent messages always sent verbatim, whatever their size
+CHAT_MIN_RECENT_MESSAGES = 2
+# Data documents larger than this are referenced by their (cached) summary instead of inline
+CHAT_DOCUMENT_TOKENS = 3000
+# Instructions opening every chat prompt
+CHAT_INSTRUCTION = (
+    "You are a helpful assistant answering questions about the reference data provided. "
+    "Use the conversation so far for context and answer the user's last message.\n"
+)
+
+def get_conversation():
+    """
+    Return this session's Ask a Question conversation
+
+    Returns:
+        dict: messages (all turns, for display), compacted (number of leading messages
+            folded into summary), summary, document (text sent with every turn)
+    """
+    if "askq_conversation" not in st.session_state:
+        st.session_state["askq_conversation"] = {
+            "messages": [], "compacted": 0, "summary": "", "document": "", "document_tokens": 0,
+        }
+    return st.session_state["askq_conversation"]
+
+def attach_document(conversation, data):
+    """
+    Set the conversation's reference data, summarizing it once when it is large
+
+    The summary comes from the same cached map-reduce summarization as the Summarize
+    page, so re-attaching a document costs nothing.
+    """
+    if estimate_tokens(data) > CHAT_DOCUMENT_TOKENS:
+        document = run_cortex(
+            "summarize_hierarchical", None, data, {"chunk_tokens": SUMMARY_CHUNK_TOKENS},
+            lambda: summarize_hierarchical(data)
+        )["summary"]
+    else:
+        document = data
+    conversation["document"] = document
+    conversation["document_tokens"] = estimate_tokens(data)
+
+def chat_context(conversation):
+    """
+    Instruction block for the next turn: reference data, rolling summary and recent messages
+
+    Returns:
+        str: Context passed to build_prompt() ahead of the new question
+    """
+    parts = [CHAT_INSTRUCTION]
+    if conversation["document"]:
+        parts.append(f"Reference data:\n{conversation['document']}\n")
+    if conversation["summary"]:
+        parts.append(f"Summary of the earlier conversation:\n{conversation['summary']}\n")
+    recent = conversation["messages"][conversation["compacted"]:]
+    if recent:
+        parts.append("Recent messages:\n" + "".join(
+            f"{message['role'].capitalize()}: {message['content']}\n" for message in recent
+        ))
+    return "\n".join(parts) + "User: "
+
+def compact_history(conversation):
+    """
+    Fold the oldest verbatim messages into the rolling summary until the rest fit CHAT_HISTORY_TOKENS
+
+    Only the messages being folded and the previous summary are summarized, so each
+    compaction costs one summarize() call over a bounded input.
+
+    Returns:
+        int: Number of messages folded
+    """
+    messages = conversation["messages"]
+    start = conversation["compacted"]
+    end = start
+    recent_tokens = sum(estimate_tokens(m["content"]) for m in messages[start:])
+    while recent_tokens > CHAT_HISTORY_TOKENS and len(messages) - end > CHAT_MIN_RECENT_MESSAGES:
+        recent_tokens -= estimate_tokens(messages[end]["content"])
+        end += 1
+    if end == start:
+        return 0
+
+    folded = "".join(f"{m['role'].capitalize()}: {m['content']}\n" for m in messages[start:end])
+    previous = f"{conversation['summary']}\n" if conversation["summary"] else ""
+    conversation["summary"] = cortex.summarize(previous + folded)
+    conversation["compacted"] = end
+    return end - start
+
+def render_chat(model_list):
+    """Multi-turn Ask a Question with a bounded prompt per turn"""
+    conversation = get_conversation()
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        # Model selection dropdown ("auto" lets the router pick within the latency budget)
+        chat_model = st.selectbox(
+            "Which Foundational Model:", [AUTO_MODEL] + model_list, index=1, key="chat_model"
+        )
+    with col2:
+        # Latency budget the router must fit when "auto" is selected
+        chat_budget = st.slider(
+            "Latency budget for auto (seconds)", min_value=1, max_value=120, value=15,
+            key="chat_budget", disabled=chat_model != AUTO_MODEL
+        )
+    with col3:
+        # Start over with an empty history (the attached data is kept)
+        if st.button("New conversation"):
+            conversation.update(messages=[], compacted=0, summary="")
+
+    # Reference data is attached once and referenced by every turn
+    with st.expander("Data for this conversation", expanded=not conversation["document"]):
+        with st.form("chat_document_form"):
+            chat_data = st.text_area(
+                "Paste the Data for Your Question",
+                label_visibility="hidden",
+                height=200,
+                placeholder="Paste Data",
+            )
+            chat_attach = st.form_submit_button("Attach Data")
+        if chat_attach:
+            try:
+                with st.spinner("Preparing the data..."):
+                    attach_document(conversation, chat_data)
+            except Exception as e:
+                st.error(f"Error occurred while attaching data: {str(e)}")
+        if conversation["document"]:
+            attached = f"~{conversation['document_tokens']:,} tokens attached"
+            if conversation["document_tokens"] > CHAT_DOCUMENT_TOKENS:
+                attached += f", referenced by a ~{estimate_tokens(conversation['document']):,} token summary"
+            st.caption(attached)
+
+    # Full transcript for display; only the summary and recent messages reach the model
+    for message in conversation["messages"]:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
+
+    question = st.chat_input("Ask a question")
+    if not question:
+        return
+
+    with st.chat_message("user"):
+        st.write(question)
+    context = chat_context(conversation)
+    with st.chat_message("assistant"):
+        try:
+            answer = render_completion(chat_model, context, question, budget_s=chat_budget)
+        except Exception as e:
+            st.error(f"Error occurred while answering: {str(e)}")
+            return
+        st.caption(f"Prompt: ~{estimate_tokens(build_prompt(context, question)):,} tokens")
+    if answer is None:
+        return
+
+    conversation["messages"] += [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer},
+    ]
+    try:
+        compact_history(conversation)
+    except Exception as e:
+        st.caption(f"History not compacted: {str(e)}")
+
+def askaquestion():
+    """General question-answering functionality using Snowflake foundational LLMs"""
+    with st.container():
+        st.header("Use a Snowflake Foundational LLM to Ask a Question")
+
+        # Foundational models from the registry
+        model_list = models_for("complete")
+
+        # Chat mode keeps a conversation going over data attached once
+        if st.toggle("Chat mode", key="askq_chat"):
+            render_chat(model_list)
+            return
+
+        # Compare mode sends the same prompt to several models at once
+        askq_compare = st.toggle("Compare models", key="askq_compare")
+
+        # Inputs only take effect when the form is submitted
+        with st.form("askq_form"):
+            if askq_compare:
+                # Multi-model selection for side-by-side comparison
+                askq_selected_models = st.multiselect(
+                    "Which Foundational Models:", model_list,
+                    default=model_list[:2], max_selections=MAX_COMPARE_MODELS
+                )
+            else:
+                # Model selection dropdown ("auto" lets the router pick within the latency budget)
+                askq_selected_models = [
+                    st.selectbox("Which Foundational Model:", [AUTO_MODEL] + model_list, index=1)
+                ]
+
+            # Text area for context data
+            askq_entered_code = st.text_area(
+                "Paste the Data for Your Question",
+                label_visibility="hidden",
+                height=300,
+                placeholder="Paste Data",
+            )
+
+            # Text area for the actual question/prompt
+            askq_model_instruct = st.text_area(
+                "Please provide Model Instructions",
+                label_visibility="hidden",
+                placeholder="Enter Prompt",
+            )
+
+            # Toggle for incremental token rendering (single-model mode only)
+            askq_stream = st.toggle(
+                "Stream response", value=True, key="askq_stream", disabled=askq_compare
+            )
+
+            # Long generations can run as background jobs (single-model mode only)
+            askq_background = st.toggle(
+                "Run in background", key="askq_background", disabled=askq_compare
+            )
+
+            # Reuse answers to near-identical questions over near-identical data (single-model mode only)
+            askq_semantic = st.toggle(
+                "Use semantic cache", value=True, key="askq_semantic", disabled=askq_compare
+            )
+
+            # Latency budget the router must fit when "auto" is selected
+            askq_budget = st.slider(
+                "Latency budget for auto (seconds)", min_value=1, max_value=120, value=15,
+                key="askq_budget", disabled=askq_compare
+            )
+
+            # Button to submit question
+            askq_submitted = st.form_submit_button("Ask My Question!")
+
+        askq_background = askq_background and not askq_compare
+        if askq_submitted and askq_background:
+            submit_completion_job(
+                "Question", askq_selected_models[0], askq_model_instruct, askq_entered_code,
+                budget_s=askq_budget
+            )
+
+        request = submitted_request(
+            "askq", askq_submitted and bool(askq_selected_models) and not askq_background,
+            compare=askq_compare, models=askq_selected_models,
+            instruction=askq_model_instruct, data=askq_entered_code, stream=askq_stream,
+            semantic=askq_semantic, budget=askq_budget,
+        )
+
+        if request:
+            if request["compare"]:
+                # Fan the prompt out to every selected model concurrently
+                render_model_comparison(request["models"], request["instruction"], request["data"])
+            else:
+                st.caption("Answer:")
+                # Call Snowflake Cortex complete, streaming tokens when possible
+                render_completion(
+                    request["models"][0], request["instruction"], request["data"],
+                    stream=request["stream"], semantic=request["semantic"], budget_s=request["budget"]
+                )
+
+# -------------------------------------
+# Transcript Insights pipeline
+# -------------------------------------
+# Pipeline stages in display order
+INSIGHT_STAGES = ["Sentiment", "Category", "Summary", "Translation", "Next Best Action"]
 
-            # Display bear mascot image
-            st.image(svg_content2, width=500)
+def run_insights(text, stages, to_code, model, instruction):
+    """
+    Compute the selected insights for one transcript in a single statement
 
-def translate():
-    """Translation functionality using Snowflake Cortex AI"""
+    Args:
+        text (str): Transcript, bound once and shared by every stage
+        stages (list): Entries of INSIGHT_STAGES to compute
+        to_code (str): Target language code for the Translation stage
+        model (str): Foundational model for the Next Best Action stage
+        instruction (str): Model instructions for the Next Best Action stage
+
+    Returns:
+        dict: Stage name -> result
+    """
+    builders = {
+        "Sentiment": lambda: cortex.sentiment_call(SHARED_INPUT),
+        "Category": lambda: cortex.classify_call(SHARED_INPUT),
+        "Summary": lambda: cortex.summarize_call(SHARED_INPUT),
+        "Translation": lambda: cortex.translate_call(SHARED_INPUT, "", to_code),
+        "Next Best Action": lambda: cortex.instructed_complete_call(model, instruction, SHARED_INPUT),
+    }
+    calls = {f"STAGE_{INSIGHT_STAGES.index(stage)}": builders[stage]() for stage in stages}
+    results = cortex.batch_over(text, **calls)
+    return {stage: results[f"STAGE_{INSIGHT_STAGES.index(stage)}"] for stage in stages}
+
+def insights():
+    """Sentiment, category, summary, translation and next best action for one transcript"""
     with st.container():
-        # Display header with logo
-        svg_content = read_svg("Snowflake.svg")
-        st.image(svg_content, width=100)
-        st.header("Translate With Snowflake Cortex")
+        st.header("Transcript Insights With Snowflake Cortex")
 
-        # Dictionary of supported languages with their language codes
-        supported_languages = {
-            "German": "de", "French": "fr", "Hindi": "hi", "Korean": "ko",
-            "Portuguese": "pt", "English": "en", "Italian": "it", "Russian": "ru",
-            "Swedish": "sv", "Spanish": "es", "Japanese": "ja", "Arabic": "ar",
-            "Polish": "pl"
-        }
+        # Foundational models from the registry for the next best action stage
+        model_list = models_for("complete")
 
-        # Create two columns for language selection
-        col1, col2 = st.columns(2)
-        with col1:
-            # Source language dropdown
-            from_language = st.selectbox(
-                "From", dict(sorted(supported_languages.items()))
+        # Inputs only take effect when the form is submitted
+        with st.form("insights_form"):
+            # Stage selection
+            insight_stages = st.multiselect(
+                "Insights:", INSIGHT_STAGES,
+                default=["Sentiment", "Category", "Summary", "Next Best Action"]
             )
-        with col2:
-            # Target language dropdown
-            to_language = st.selectbox("To", dict(sorted(supported_languages.items())))
-
-        # Text area for input text to translate
-        xlate_entered_text = st.text_area(
-            "Enter text",
-            label_visibility="hidden",
-            height=300,
-            placeholder="For example: call transcript",
+
+            col1, col2 = st.columns(2)
+            with col1:
+                # Target language for the translation stage
+                insight_language = st.selectbox(
+                    "Translate to:", dict(sorted(SUPPORTED_LANGUAGES.items())),
+                    index=sorted(SUPPORTED_LANGUAGES).index("Spanish")
+                )
+            with col2:
+                # Model for the next best action stage
+                insight_model = st.selectbox("Next Best Action Model:", model_list)
+
+            # Text area for the transcript
+            insight_entered_text = st.text_area(
+                "Paste the Call Transcript",
+                label_visibility="hidden",
+                height=300,
+                placeholder="Paste Call Transcript",
+            )
+
+            # Instructions for the next best action stage
+            insight_model_instruct = st.text_area(
+                "Next Best Action Instructions",
+                "Based on these data, please provide the next best action",
+            )
+            insight_submitted = st.form_submit_button("Analyze Transcript")
+
+        request = submitted_request(
+            "insights", insight_submitted and bool(insight_entered_text) and bool(insight_stages),
+            text=insight_entered_text, stages=insight_stages,
+            to_code=SUPPORTED_LANGUAGES[insight_language],
+            model=insight_model, instruction=insight_model_instruct,
         )
 
-        # Process translation if text is entered
-        if xlate_entered_text:
-            # Escape single quotes to prevent SQL injection
-            xlate_entered_text = xlate_entered_text.replace("'", "\\'")
+        if request:
+            # All stages run as columns of one SELECT; the record is cached as a whole
+            options = {key: request[key] for key in ("stages", "to_code", "instruction")}
+            insight_results = run_cortex(
+                "insights", request["model"], request["text"], options,
+                lambda: run_insights(
+                    request["text"], request["stages"], request["to_code"],
+                    request["model"], request["instruction"]
+                )
+            )
 
-            # Call Snowflake Cortex translate function via SQL
-            xlate_cortex_response = (
-                session.sql(f"select snowflake.cortex.translate('{xlate_entered_text}','{supported_languages[from_language]}','{supported_languages[to_language]}') as response").to_pandas().iloc[0]["RESPONSE"])
-            # Display translated text
-            st.write(xlate_cortex_response)
+            # Display each stage's result
+            if "Sentiment" in insight_results:
+                st.metric("Sentiment", f"{insight_results['Sentiment']:.2f}",
+                          help="Score is between -1 and 1; -1 = Most negative, 1 = Positive, 0 = Neutral")
+            if "Category" in insight_results:
+                st.caption("Category:")
+                st.write(", ".join(insight_results["Category"].get("labels", [])))
+            for stage in ("Summary", "Translation", "Next Best Action"):
+                if stage in insight_results:
+                    st.caption(f"{stage}:")
+                    st.write(insight_results[stage])
 
-def sentiment():
-    """Sentiment analysis functionality using Snowflake Cortex AI"""
-    with st.container():
-        st.header("Sentiment Analysis With Snowflake Cortex")
+# -------------------------------------
+# Background jobs for long-running calls
+# -------------------------------------
+# How often the sidebar job list polls running queries
+JOB_POLL_SECONDS = 2
 
-        # Text area for entering transcript or text to analyze
-        sent_entered_transcript = st.text_area(
-            "Enter call transcript",
-            label_visibility="hidden",
-            height=400,
-            placeholder="Enter call transcript",
-        )
+def get_job_queue():
+    """
+    Return this session's job queue
 
-        # Escape single quotes for SQL safety
-        sent_entered_transcript = sent_entered_transcript.replace("'", "\\'")
+    Returns:
+        JobQueue: The session's queue
+    """
+    if "job_queue" not in st.session_state:
+        st.session_state["job_queue"] = JobQueue(session, tracer=get_tracer())
+    return st.session_state["job_queue"]
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_list():
+    """Poll running jobs and list all jobs with cancel/remove actions"""
+    queue = get_job_queue()
+    if not queue.jobs:
+        return
+    running = queue.poll()
+    st.subheader(f"Jobs ({running} running)")
+    for job_id, job in list(queue.jobs.items()):
+        elapsed = (job["finished_at"] or time.time()) - job["submitted_at"]
+        with st.expander(f"{job['label']} - {job['status']} ({elapsed:.0f}s)"):
+            if job["status"] == "done":
+                st.write(job["result"])
+            elif job["status"] == "failed":
+                st.error(job["error"])
+            st.caption(f"Query ID: {job['query_id']}")
+            if job["status"] == "running":
+                if st.button("Cancel", key=f"cancel_{job_id}"):
+                    queue.cancel(job_id)
+                    st.rerun(scope="fragment")
+            elif st.button("Remove", key=f"remove_{job_id}"):
+                queue.remove(job_id)
+                st.rerun(scope="fragment")
+
+def submit_completion_job(label, model, instruction, data, budget_s=None):
+    """
+    Queue a completion as a background job and tell the user where to find it
 
-        # Process sentiment analysis if text is entered
-        if sent_entered_transcript:
-            # Call Snowflake Cortex sentiment analysis function
-            sent_cortex_response = session.sql(f"select snowflake.cortex.sentiment('{sent_entered_transcript}') as sentiment").to_pandas();
+    Args:
+        label (str): Page-specific description for the job list
+        model (str): Foundational model name, or AUTO_MODEL for the router's first choice
+        instruction (str): Model instructions
+        data (str): Pasted data or transcript
+        budget_s (float): Latency budget for AUTO_MODEL
+    """
+    if model == AUTO_MODEL:
+        candidates = route_models(build_prompt(instruction, data), budget_s, get_tracer())
+        if not candidates:
+            st.error("No model has a context window large enough for this prompt.")
+            return
+        model = candidates[0]["model"]
+    get_job_queue().submit(
+        f"{label} ({model})", cortex.complete_call(model, build_prompt(instruction, data)), page=cortex.page
+    )
+    st.info("Submitted as a background job; the result will appear in the sidebar job list.")
 
-            st.caption(
-                "Score is between -1 and 1; -1 = Most negative, 1 = Positive, 0 = Neutral"
-            )
-            # Display sentiment results in a dataframe
-            st.dataframe(sent_cortex_response, hide_index=True, width=100)
+#-------------------------------------
+# Constants and settings for file handling
+# -------------------------------------
+# File extensions that can be previewed in the application
+PREVIEWABLE_EXTENSIONS = ['.txt', '.tsv', '.csv', '.jpg', '.img', '.webp', '.jpeg', '.mp3', '.mpg4']
 
-def supersum():
-    """Text summarization functionality using Snowflake Cortex AI"""
-    with st.container():
-        st.header("Summarize Data With Snowflake Cortex")
+# -------------------------------------
+# Stage existence check and creation
+# -------------------------------------
+def get_stage_registry():
+    """
+    Return this session's stage registry, creating and warming it on first use
 
-        # Text area for entering data to summarize
-        ssum_entered_text = st.text_area(
-            "Enter data to summarize",
-            label_visibility="hidden",
-            height=400,
-            placeholder="Enter data to summarize",
-        )
+    Returns:
+        StageRegistry: The session's registry
+    """
+    if "stage_registry" not in st.session_state:
+        registry = StageRegistry(session)
+        try:
+            registry.warm()
+        except Exception:
+            pass  # Lookups will retry on demand
+        st.session_state["stage_registry"] = registry
+    return st.session_state["stage_registry"]
 
-        # Escape single quotes for SQL safety
-        ssum_entered_text = ssum_entered_text.replace("'", "\\'")
+def ensure_stage_exists(stage_name_no_at: str):
+    """
+    Creates a Snowflake stage if it doesn't exist. Does nothing if it already exists.
 
-        # Process summarization if text is entered
-        if ssum_entered_text:
-            # Call Snowflake Cortex summarize function
-            ssum_cortex_response = session.sql(
-                f"select snowflake.cortex.summarize('{ssum_entered_text}') as RESPONSE"
-            ).to_pandas().iloc[0]["RESPONSE"]
+    Existence is answered from the session's stage registry, so reruns do not
+    issue any metadata queries.
 
-            # Display summarized results
-            st.caption("Summarized data:")
-            st.write(ssum_cortex_response)
+    Args:
+        stage_name_no_at (str): Stage name without the @ prefix
+    """
+    registry = get_stage_registry()
+    if registry.exists(stage_name_no_at):
+        return
 
-def nextba():
-    """Next Best Action recommendation using Snowflake foundational LLMs"""
-    with st.container():
-        st.header("Use a Snowflake Foundational LLM to Identify Customer Next Best Action")
+    # Create stage if it doesn't exist
+    try:
+        registry.create(stage_name_no_at)
+        st.sidebar.success(f"Stage @{stage_name_no_at} has been created.")
+    except Exception as e:
+        st.sidebar.error(f"Failed to create stage: {str(e)}")
+        st.stop()  # Stop execution if stage creation fails
 
-        # List of available foundational models
-        model_list = [
-            "claude-4-sonnet", "claude-3-7-sonnet", 'llama4-maverick', 'llama4-scout',
-            "deepseek-r1", "snowflake-arctic", "mistral-large2", "reka-flash",
-            "reka-core", "llama3.1-405b", "llama3.2-1b", "llama3.2-3b", "mistral-7b"
-        ]
-
-        # Model selection dropdown
-        next_selected_model = st.selectbox("Which Foundational Model:", model_list)
-
-        # Text area for input data
-        next_entered_code = st.text_area(
-            "Paste the Data for Your Question",
-            label_visibility="hidden",
-            height=300,
-            placeholder="Paste Data",
-        )
+def render_stage_refresh():
+    """Button that invalidates the session's cached stage metadata"""
+    if st.button("Refresh stage metadata"):
+        get_stage_registry().invalidate()
 
-        # Escape single quotes for SQL safety
-        next_entered_code = next_entered_code.replace("'", "\\'")
+# -------------------------------------
+# Content-addressed uploads
+# -------------------------------------
+# Largest file accepted for upload
+MAX_UPLOAD_BYTES = int(os.environ.get("GENAI_MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+# Upload digests kept per session, keyed by UploadedFile.file_id
+UPLOAD_HASH_MEMO_MAX_ENTRIES = 64
+# Text formats that may be gzip-compressed on upload
+COMPRESSIBLE_EXTENSIONS = ['.txt', '.csv', '.tsv', '.json']
+
+def content_hash(source):
+    """
+    Hash file content for content-addressed stage paths
 
-        # Default instruction prompt for the model
-        next_default_model_instruct = """Based on these data, please provide the next best action"""
+    File objects are hashed in place (through their buffer when they are
+    in-memory, in chunks otherwise) without copying the content. Streamlit
+    uploads are hashed once per session: their digest is remembered by
+    file_id, which changes whenever a new file is uploaded.
 
-        # Text area for custom model instructions
-        next_model_instruct = st.text_area(
-            "Please provide Model Instructions",
-            next_default_model_instruct,
-            label_visibility="hidden",
-            placeholder="Enter Prompt",
-        )
+    Args:
+        source: bytes or a seekable file object
 
-        # Button to trigger next best action analysis
-        if st.button("Next Best Action!"):
-            # Call Snowflake Cortex complete function with selected model
-            next_cortex_response = session.sql(
-                f"select snowflake.cortex.complete('{next_selected_model}',concat('[INST]','{next_model_instruct}','{next_entered_code}','[/INST]')) as RESPONSE"
-            ).to_pandas().iloc[0]["RESPONSE"]
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    file_id = getattr(source, "file_id", None)
+    if file_id is None:
+        return hash_content(source)
+
+    memo = st.session_state.setdefault("upload_hash_memo", OrderedDict())
+    if file_id not in memo:
+        memo[file_id] = hash_content(source)
+    memo.move_to_end(file_id)
+    while len(memo) > UPLOAD_HASH_MEMO_MAX_ENTRIES:
+        memo.popitem(last=False)
+    return memo[file_id]
+
+def put_stage_object(stage_name, file_path, source, compress=False, on_progress=None):
+    """
+    Stream content to a stage path unless an object is already there
 
-            # Display the recommendation
-            st.caption("Answer:")
-            st.write(next_cortex_response)
+    File objects are passed to put_stream directly rather than copied into a
+    new buffer, so peak memory does not grow with file size.
 
-def classify():
-    """Text classification functionality using Snowflake Cortex AI"""
-    with st.container():
-        st.header("Classify Data With Snowflake Cortex")
+    Args:
+        stage_name (str): Stage name with the @ prefix
+        file_path (str): Path relative to the stage root
+        source: bytes or a seekable file object
+        compress (bool): gzip the file on upload (stored as <file_path>.gz)
+        on_progress (callable): Called with (bytes read, total bytes) during the upload
 
-        # Text area for data to classify
-        class_entered_text = st.text_area(
-            "Enter data to Classify",
-            label_visibility="hidden",
-            height=400,
-            placeholder="Enter data to classify",
-        )
+    Returns:
+        float: Upload time in seconds, or None if the upload was skipped
+    """
+    registry = get_stage_registry()
+    stored_path = f"{file_path}.gz" if compress else file_path
+    if registry.has_object(stage_name, stored_path):
+        return None
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)  # Shares the buffer until written to
+    else:
+        source.seek(0)
+        stream = source
+    if on_progress is not None:
+        stream = ProgressReader(stream, source_size(source), on_progress)
+
+    start = time.perf_counter()
+    session.file.put_stream(
+        stream,
+        f"{stage_name}/{file_path}",
+        auto_compress=compress,
+        overwrite=True
+    )
+    registry.objects.setdefault(normalize_stage_name(stage_name), set()).add(stored_path)
+    return time.perf_counter() - start
 
-        # Escape single quotes for SQL safety
-        class_entered_text = class_entered_text.replace("'", "\\'")
+def upload_to_stage(stage_name, file_name, source, compress=False):
+    """
+    Upload a file to <stage>/<sha256>/<name>, skipping the PUT when it is already there
 
-        # Process classification if text is entered
-        if class_entered_text:
-            # Call Snowflake Cortex classify_text function with predefined categories
-            class_cortex_response = session.sql(
-                f"select snowflake.cortex.ai_classify('{class_entered_text}',['Complete Refund','Exchange Tickets','Refund Fees', 'Discount Sale','Send a Nice Thank You E-mail']) as Answer"
-            ).to_pandas().iloc[0]["ANSWER"]
+    Args:
+        stage_name (str): Stage name with the @ prefix
+        file_name (str): File name to store
+        source: bytes or a seekable file object (e.g. Streamlit UploadedFile)
+        compress (bool): gzip the file on upload
 
-            # Display classification result
-            st.caption("Classified data:")
-            st.write(class_cortex_response)
+    Returns:
+        tuple: (path relative to the stage root, content hash)
+    """
+    size = source_size(source)
+    if size > MAX_UPLOAD_BYTES:
+        raise ValueError(
+            f"'{file_name}' is {size / 1024 / 1024:,.0f} MB; the limit is {MAX_UPLOAD_BYTES / 1024 / 1024:,.0f} MB"
+        )
 
-def emailcomplete():
-    """Email generation functionality using Snowflake foundational LLMs"""
-    with st.container():
-        st.header("Generate a Customer E-Mail With Snowflake Cortex Complete")
+    digest = content_hash(source)
+    file_path = f"{digest}/{file_name}"
 
-        # List of available models for email generation
-        model_list = [
-            "claude-4-sonnet", "claude-3-7-sonnet", "snowflake-arctic",
-            'llama4-maverick', 'llama4-scout', "deepseek-r1", "mistral-large",
-            "reka-flash", "reka-core", "llama3.1-405b"
-        ]
-
-        # Model selection dropdown
-        email_selected_model = st.selectbox("Which Foundational Model:", model_list)
-
-        # Text area for call transcript input
-        email_entered_code = st.text_area(
-            "Paste the Call Transcript to use for E-Mail Generation:",
-            label_visibility="hidden",
-            height=300,
-            placeholder="Paste Call Transcript",
+    progress = st.empty()
+    elapsed = put_stage_object(
+        stage_name, file_path, source, compress=compress,
+        on_progress=lambda done, total: progress.progress(
+            done / total if total else 1.0, text=f"Uploading {done:,} of {total:,} bytes"
         )
+    )
+    progress.empty()
+    if elapsed is None:
+        st.success(f"File '{file_name}' is already on the stage; upload skipped.")
+    else:
+        st.success(f"File '{file_name}' has been uploaded successfully!")
+        st.caption(f"Uploaded {size:,} bytes in {elapsed:.2f}s")
+    return (f"{file_path}.gz" if compress else file_path), digest
 
-        # Escape single quotes for SQL safety
-        email_entered_code = email_entered_code.replace("'", "\\'")
+# -------------------------------------
+# Image preprocessing before upload
+# -------------------------------------
+# Longest image edge each model benefits from; larger images are downsampled by the model anyway
+MODEL_MAX_IMAGE_DIMENSION = {
+    model: info.max_image_dimension for model, info in MODEL_REGISTRY.items() if info.max_image_dimension
+}
+DEFAULT_MAX_IMAGE_DIMENSION = 1024
+# Re-encoding formats with their file extensions
+IMAGE_OUTPUT_FORMATS = {"WEBP": ".webp", "JPEG": ".jpg"}
+# Preprocessed images kept per session so reruns skip decoding and re-encoding
+IMAGE_UPLOAD_MEMO_MAX_ENTRIES = 8
 
-        # Default email generation instructions
-        email_default_model_instruct = """Please create an email for me that describes the issue in detail and provides a solution. Make the e-mail from me, the Director of Customer Relations at The Big Ticket Co, and also give the customer a 10% discount with code: CS10OFF of a future order"""
+def render_image_preprocessing_options(model, key):
+    """
+    Controls for resizing and re-encoding images before upload
 
-        # Text area for custom email instructions
-        email_model_instruct = st.text_area(
-            "Please Provide E-Mail Generation Model Instructions: ",
-            email_default_model_instruct,
-            label_visibility="hidden",
-            placeholder="Enter Prompt",
-        )
+    Args:
+        model (str): Selected multi-modal model, used for the default maximum dimension
+        key (str): Widget key prefix
 
-        # Button to trigger email generation
-        if st.button("Generate E-Mail"):
-            # Call Snowflake Cortex complete function for email generation
-            email_cortex_response = session.sql(
-                f"select snowflake.cortex.complete('{email_selected_model}',concat('[INST]','{email_model_instruct}','{email_entered_code}','[/INST]')) as RESPONSE"
-            ).to_pandas().iloc[0]["RESPONSE"]
+    Returns:
+        dict: Preprocessing settings, or None when preprocessing is off or Pillow is missing
+    """
+    if Image is None:
+        st.caption("Install Pillow to resize images before upload.")
+        return None
+
+    with st.expander("Image preprocessing"):
+        if not st.toggle("Resize and re-encode before upload", value=True, key=f"{key}_preprocess"):
+            return None
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            max_dimension = st.number_input(
+                "Max dimension (px)", min_value=256, max_value=8192, step=64,
+                value=MODEL_MAX_IMAGE_DIMENSION.get(model, DEFAULT_MAX_IMAGE_DIMENSION),
+                key=f"{key}_max_dimension_{model}"
+            )
+        with col2:
+            image_format = st.selectbox("Format", list(IMAGE_OUTPUT_FORMATS), key=f"{key}_format")
+        with col3:
+            quality = st.slider("Quality", 50, 95, 85, key=f"{key}_quality")
+    return {"max_dimension": int(max_dimension), "format": image_format, "quality": quality}
 
-            # Display generated email
-            st.caption("Customer E-Mail:")
-            st.write(email_cortex_response)
+def preprocess_image(file_name, source, settings):
+    """
+    Downscale an image, re-encode it and drop its metadata (EXIF)
 
-def askaquestion():
-    """General question-answering functionality using Snowflake foundational LLMs"""
-    with st.container():
-        st.header("Use a Snowflake Foundational LLM to Ask a Question")
+    The original is kept when re-encoding would not make it smaller.
 
-        # List of available models for Q&A
-        model_list = [
-            "claude-4-sonnet", "claude-3-7-sonnet", "snowflake-arctic",
-            'llama4-maverick', 'llama4-scout', "deepseek-r1", "mistral-large2",
-            "reka-flash", "reka-core", "mixtral-8x7b"
-        ]
-
-        # Model selection dropdown
-        askq_selected_model = st.selectbox("Which Foundational Model:", model_list)
-
-        # Text area for context data
-        askq_entered_code = st.text_area(
-            "Paste the Data for Your Question",
-            label_visibility="hidden",
-            height=300,
-            placeholder="Paste Data",
-        )
+    Args:
+        file_name (str): Original file name
+        source: Original image as bytes or a seekable file object
+        settings (dict): Output of render_image_preprocessing_options()
 
-        # Escape single quotes for SQL safety
-        askq_entered_code = askq_entered_code.replace("'", "\\'")
+    Returns:
+        tuple: (file name, image content)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    source.seek(0)
+    with Image.open(source) as original:
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((settings["max_dimension"], settings["max_dimension"]), Image.LANCZOS)
+        if settings["format"] == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        # No exif= argument, so no metadata is written
+        image.save(output, format=settings["format"], quality=settings["quality"])
+
+    processed = output.getvalue()
+    if len(processed) >= source_size(source):
+        return file_name, source
+    return os.path.splitext(file_name)[0] + IMAGE_OUTPUT_FORMATS[settings["format"]], processed
+
+def prepare_image_upload(file_name, source, settings):
+    """
+    Apply preprocessing (when enabled) and report the size change
 
-        # Text area for the actual question/prompt
-        askq_model_instruct = st.text_area(
-            "Please provide Model Instructions",
-            label_visibility="hidden",
-            placeholder="Enter Prompt",
-        )
+    Results are memoized in session state by (upload file id or content hash,
+    settings), so reruns with the same image and settings reuse the output.
 
-        # Button to submit question
-        if st.button("Ask My Question!"):
-            # Call Snowflake Cortex complete function with question and data
-            askq_cortex_response = session.sql(
-                f"select snowflake.cortex.complete('{askq_selected_model}',concat('[INST]','{askq_model_instruct}','{askq_entered_code}','[/INST]')) as RESPONSE"
-            ).to_pandas().iloc[0]["RESPONSE"]
+    Args:
+        file_name (str): Original file name
+        source: Original image as bytes or a seekable file object
+        settings (dict): Preprocessing settings, or None
 
-            # Display the answer
-            st.caption("Answer:")
-            st.write(askq_cortex_response)
+    Returns:
+        tuple: (file name, content to upload - the untouched source when not preprocessed)
+    """
+    if settings is None or os.path.splitext(file_name)[1].lower() not in IMAGE_EXTENSIONS:
+        return file_name, source
+
+    # UploadedFile.file_id identifies the upload without reading it; other sources are hashed
+    key = (getattr(source, "file_id", None) or content_hash(source), file_name, tuple(sorted(settings.items())))
+    memo = st.session_state.setdefault("image_upload_memo", OrderedDict())
+    if key not in memo:
+        memo[key] = (source_size(source), *preprocess_image(file_name, source, settings))
+    memo.move_to_end(key)
+    while len(memo) > IMAGE_UPLOAD_MEMO_MAX_ENTRIES:
+        memo.popitem(last=False)
+
+    original_size, new_name, new_data = memo[key]
+    st.caption(
+        f"{file_name}: {original_size:,} bytes -> {source_size(new_data):,} bytes "
+        f"({1 - source_size(new_data) / original_size:.0%} smaller)"
+    )
+    return new_name, new_data
 
-#-------------------------------------
-# Constants and settings for file handling
 # -------------------------------------
-# File extensions that can be previewed in the application
-PREVIEWABLE_EXTENSIONS = ['.txt', '.tsv', '.csv', '.jpg', '.img', '.webp', '.jpeg', '.mp3', '.mpg4']
+# Batch image analysis over the stage directory table
+# -------------------------------------
+# Results of batch image analysis, one row per image per batch
+IMAGE_RESULTS_TABLE = "GENAI_IMAGE_RESULTS"
+# Files picked up from the directory table in "all images" mode
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp']
+# Stage names are inlined into DIRECTORY(@...) so only allow plain (optionally qualified) identifiers
+STAGE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_$]+(\.[A-Za-z0-9_$]+){0,2}$")
+
+def ensure_directory_table(stage_name_no_at):
+    """
+    Enable and refresh the stage's directory table
+
+    Args:
+        stage_name_no_at (str): Stage name without the @ prefix
+    """
+    if not STAGE_NAME_PATTERN.match(stage_name_no_at):
+        raise ValueError(f"Invalid stage name: {stage_name_no_at!r}")
+    registry = get_stage_registry()
+    properties = registry.properties(stage_name_no_at) or {}
+    if properties.get("directory_enabled") != "Y":
+        session.sql(f"ALTER STAGE {stage_name_no_at} SET DIRECTORY = (ENABLE = TRUE)").collect()
+        registry.invalidate(stage_name_no_at)
+    session.sql(f"ALTER STAGE {stage_name_no_at} REFRESH").collect()
+
+def analyze_image_batch(stage_name_no_at, model, prompt, file_paths=None):
+    """
+    Categorize staged images with one ai_complete query over the directory table
+
+    Responses are parsed into Animal/Breed/Environment columns and inserted into
+    IMAGE_RESULTS_TABLE server-side.
+
+    Args:
+        stage_name_no_at (str): Stage name without the @ prefix
+        model (str): Multi-modal model name
+        prompt (str): Model instructions
+        file_paths (list): Relative paths to analyze, or None for every image on the stage
+
+    Returns:
+        str: Batch ID of the inserted rows
+    """
+    ensure_directory_table(stage_name_no_at)
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {IMAGE_RESULTS_TABLE} (
+            BATCH_ID STRING,
+            RELATIVE_PATH STRING,
+            MODEL STRING,
+            ANIMAL STRING,
+            BREED STRING,
+            ENVIRONMENT STRING,
+            RESPONSE STRING,
+            ANALYZED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+
+    if file_paths is None:
+        extensions = ", ".join(sql_string_literal(f"%{e}") for e in IMAGE_EXTENSIONS)
+        file_filter, filter_params = f"RELATIVE_PATH ilike any ({extensions})", []
+    else:
+        file_filter = "RELATIVE_PATH in (select value::string from table(flatten(parse_json(?))))"
+        filter_params = [json.dumps(file_paths)]
+
+    batch_id = uuid.uuid4().hex
+    model_literal = CortexClient.model_literal(model)
+    with cortex.traced("image_batch", model, prompt):
+        session.sql(
+            f"""insert into {IMAGE_RESULTS_TABLE} (BATCH_ID, RELATIVE_PATH, MODEL, ANIMAL, BREED, ENVIRONMENT, RESPONSE)
+                with responses as (
+                    select RELATIVE_PATH,
+                           snowflake.cortex.ai_complete({model_literal}, ?, TO_FILE(?, RELATIVE_PATH)) as RESPONSE
+                    from DIRECTORY(@{stage_name_no_at})
+                    where {file_filter}
+                ), parsed as (
+                    select RELATIVE_PATH, RESPONSE,
+                           try_parse_json(regexp_substr(RESPONSE, '\\\\{{.*\\\\}}', 1, 1, 's')) as J
+                    from responses
+                )
+                select ?, RELATIVE_PATH, {model_literal},
+                       coalesce(J:Animal, J:animal)::string,
+                       coalesce(J:Breed, J:breed)::string,
+                       coalesce(J:Environment, J:environment)::string,
+                       RESPONSE
+                from parsed""",
+            params=[prompt, f"@{stage_name_no_at}"] + filter_params + [batch_id]
+        ).collect()
+    return batch_id
 
 # -------------------------------------
-# Stage existence check and creation
+# Incremental stage processing
 # -------------------------------------
-def ensure_stage_exists(stage_name_no_at: str):
+# One row per (stage, file, model, prompt) with the fingerprint of the file version processed
+LEDGER_TABLE = "GENAI_PROCESSED_FILES"
+# Files picked up from the directory table for audio processing
+AUDIO_EXTENSIONS = ['.mp3', '.wav', '.ogg', '.flac', '.m4a', '.mp4']
+
+def ensure_ledger_table():
+    """Create the processed-files ledger once per session"""
+    if st.session_state.get("ledger_table_ready"):
+        return
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+            STAGE_NAME STRING,
+            RELATIVE_PATH STRING,
+            FINGERPRINT STRING,
+            MODEL STRING,
+            PROMPT_HASH STRING,
+            RESULT STRING,
+            PROCESSED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+    st.session_state["ledger_table_ready"] = True
+
+def pending_files_sql(stage_name_no_at, kind, model, prompt):
     """
-    Creates a Snowflake stage if it doesn't exist. Does nothing if it already exists.
+    Query selecting stage files not yet processed with this model and prompt
+
+    A file is pending when the ledger has no row for it, or the row was recorded
+    for a different version (MD5/ETag) of the file.
+
+    Args:
+        stage_name_no_at (str): Stage name without the @ prefix
+        kind (str): "image" or "audio"
+        model (str): Model name (AI_TRANSCRIBE for audio)
+        prompt (str): Model instructions ("" for audio)
+
+    Returns:
+        tuple: (SQL selecting RELATIVE_PATH and FINGERPRINT, bind values)
+    """
+    if not STAGE_NAME_PATTERN.match(stage_name_no_at):
+        raise ValueError(f"Invalid stage name: {stage_name_no_at!r}")
+    extensions = IMAGE_EXTENSIONS if kind == "image" else AUDIO_EXTENSIONS
+    patterns = ", ".join(sql_string_literal(f"%{e}") for e in extensions)
+    query = f"""
+        select d.RELATIVE_PATH, coalesce(d.MD5, d.ETAG) as FINGERPRINT
+        from DIRECTORY(@{stage_name_no_at}) d
+        where d.RELATIVE_PATH ilike any ({patterns})
+          and d.RELATIVE_PATH not like '%/segments-%'
+          and not exists (
+              select 1 from {LEDGER_TABLE} l
+              where l.STAGE_NAME = ? and l.RELATIVE_PATH = d.RELATIVE_PATH
+                and l.FINGERPRINT = coalesce(d.MD5, d.ETAG)
+                and l.MODEL = ? and l.PROMPT_HASH = ?
+          )"""
+    return query, [stage_name_no_at.upper(), model, text_fingerprint(prompt)]
+
+def count_pending_files(stage_name_no_at, kind, model, prompt):
+    """
+    Number of new or changed files waiting to be processed
+
+    Returns:
+        int: Pending file count
+    """
+    ensure_ledger_table()
+    query, params = pending_files_sql(stage_name_no_at, kind, model, prompt)
+    return session.sql(f"select count(*) from ({query})", params=params).collect()[0][0]
+
+def process_new_files(stage_name_no_at, kind, model, prompt):
+    """
+    Run ai_complete / AI_TRANSCRIBE over pending files only and upsert the results
 
     Args:
         stage_name_no_at (str): Stage name without the @ prefix
+        kind (str): "image" or "audio"
+        model (str): Model name (AI_TRANSCRIBE for audio)
+        prompt (str): Model instructions ("" for audio)
+
+    Returns:
+        int: Number of files processed
+    """
+    ensure_ledger_table()
+    pending, pending_params = pending_files_sql(stage_name_no_at, kind, model, prompt)
+    if kind == "image":
+        result_expression = f"snowflake.cortex.ai_complete({CortexClient.model_literal(model)}, ?, TO_FILE(?, p.RELATIVE_PATH))"
+        result_params = [prompt, f"@{stage_name_no_at}"]
+    else:
+        result_expression = "AI_TRANSCRIBE(TO_FILE(?, p.RELATIVE_PATH))::string"
+        result_params = [f"@{stage_name_no_at}"]
+
+    with cortex.traced(f"process_new_{kind}", model, prompt):
+        rows = session.sql(
+            f"""merge into {LEDGER_TABLE} l
+                using (
+                    select ? as STAGE_NAME, p.RELATIVE_PATH, p.FINGERPRINT, ? as MODEL, ? as PROMPT_HASH,
+                           {result_expression} as RESULT
+                    from ({pending}) p
+                ) s
+                on l.STAGE_NAME = s.STAGE_NAME and l.RELATIVE_PATH = s.RELATIVE_PATH
+                   and l.MODEL = s.MODEL and l.PROMPT_HASH = s.PROMPT_HASH
+                when matched then update set
+                    FINGERPRINT = s.FINGERPRINT, RESULT = s.RESULT, PROCESSED_AT = current_timestamp()
+                when not matched then insert (STAGE_NAME, RELATIVE_PATH, FINGERPRINT, MODEL, PROMPT_HASH, RESULT)
+                    values (s.STAGE_NAME, s.RELATIVE_PATH, s.FINGERPRINT, s.MODEL, s.PROMPT_HASH, s.RESULT)""",
+            params=[stage_name_no_at.upper(), model, text_fingerprint(prompt)] + result_params + pending_params
+        ).collect()
+    # MERGE returns inserted and updated row counts
+    return sum(rows[0][i] for i in range(len(rows[0]))) if rows else 0
+
+def render_incremental_processing(stage_name_no_at, kind, model, prompt):
+    """
+    Pending-count indicator and "process new files" action for a stage
+
+    The pending count is cached per session until files are processed or the
+    user refreshes it.
+
+    Args:
+        stage_name_no_at (str): Stage name without the @ prefix
+        kind (str): "image" or "audio"
+        model (str): Model name (AI_TRANSCRIBE for audio)
+        prompt (str): Model instructions ("" for audio)
     """
+    st.subheader("Incremental Processing")
+    counts = st.session_state.setdefault("pending_counts", {})
+    count_key = (stage_name_no_at.upper(), kind, model, text_fingerprint(prompt))
+
+    col1, col2, col3 = st.columns(3)
+    with col2:
+        refresh = st.button("Refresh pending count", key=f"refresh_pending_{kind}")
+    with col3:
+        process = st.button("Process new files", key=f"process_new_{kind}")
+
     try:
-        # Check if stage exists by attempting to describe it
-        session.sql(f"DESC STAGE {stage_name_no_at}").collect()
-    except:
-        # Create stage if it doesn't exist
+        if refresh or process:
+            counts.pop(count_key, None)
+        if count_key not in counts:
+            # The directory table only reflects new files after a refresh
+            ensure_directory_table(stage_name_no_at)
+        if process:
+            with st.spinner("Processing new and changed files..."):
+                processed = process_new_files(stage_name_no_at, kind, model, prompt)
+            st.success(f"Processed {processed} file(s); results saved to {LEDGER_TABLE}.")
+        if count_key not in counts:
+            counts[count_key] = count_pending_files(stage_name_no_at, kind, model, prompt)
+    except Exception as e:
+        st.error(f"Error occurred while processing stage files: {str(e)}")
+        return
+
+    with col1:
+        st.metric("Pending files", counts[count_key])
+
+def render_image_batch(stage_name_no_at, model_list, default_prompt):
+    """
+    Batch mode of the image page: upload many images or use the stage contents
+
+    Args:
+        stage_name_no_at (str): Stage name without the @ prefix
+        model_list (list): Multi-modal models to choose from
+        default_prompt (str): Default model instructions
+    """
+    stage_name = f"@{stage_name_no_at}"
+    st.header("Batch Analysis")
+    source = st.radio(
+        "Images to analyze:", ["Uploaded files", "All images on the stage", "New or changed images on the stage"],
+        horizontal=True
+    )
+
+    uploaded_files = []
+    if source == "Uploaded files":
+        uploaded_files = st.file_uploader(
+            "Choose images", type=[e.lstrip(".") for e in IMAGE_EXTENSIONS], accept_multiple_files=True
+        )
+
+    # Model and prompt for the batch
+    batch_model = st.selectbox("Which Multi-Modal Model:", model_list, key="image_batch_model")
+    batch_instruct = st.text_area(
+        "Please Provide Model Instructions: ", default_prompt, height=150, key="image_batch_instruct"
+    )
+
+    if source == "New or changed images on the stage":
+        # Only files missing from the processed-files ledger are sent to the model
+        render_incremental_processing(stage_name_no_at, "image", batch_model, batch_instruct)
+        return
+
+    preprocessing = None
+    if source == "Uploaded files":
+        preprocessing = render_image_preprocessing_options(batch_model, "image_batch")
+
+    if st.button("Analyze Images", disabled=source == "Uploaded files" and not uploaded_files):
         try:
-            session.sql(f"""
-                CREATE STAGE {stage_name_no_at}
-                ENCRYPTION = (TYPE = 'SNOWFLAKE_SSE')
-            """).collect()
-            st.sidebar.success(f"Stage @{stage_name_no_at} has been created.")
+            file_paths = None
+            if source == "Uploaded files":
+                # Content-addressed uploads; one LIST of the stage tells which are already there
+                progress = st.progress(0.0, text=f"Uploading {len(uploaded_files)} images...")
+                registry = get_stage_registry()
+                registry.list_objects(stage_name)
+
+                def prepared():
+                    for uploaded in uploaded_files:
+                        name, data = prepare_image_upload(uploaded.name, uploaded, preprocessing)
+                        yield f"{content_hash(data)}/{name}", data
+
+                file_paths = registry.put_objects(
+                    stage_name, prepared(),
+                    on_progress=lambda done: progress.progress(
+                        done / len(uploaded_files), text=f"Uploaded {done} of {len(uploaded_files)}"
+                    )
+                )
+
+            with st.spinner("Analyzing images..."):
+                st.session_state["image_batch_id"] = analyze_image_batch(
+                    stage_name_no_at, batch_model, batch_instruct, file_paths
+                )
         except Exception as e:
-            st.sidebar.error(f"Failed to create stage: {str(e)}")
-            st.stop()  # Stop execution if stage creation fails
+            st.error(f"Error occurred while analyzing images: {str(e)}")
+
+    # Show the most recent batch from the results table
+    batch_id = st.session_state.get("image_batch_id")
+    if batch_id:
+        results = session.sql(
+            f"""select RELATIVE_PATH, ANIMAL, BREED, ENVIRONMENT, MODEL, ANALYZED_AT
+                from {IMAGE_RESULTS_TABLE} where BATCH_ID = ? order by RELATIVE_PATH""",
+            params=[batch_id]
+        ).to_pandas()
+        st.caption(f"{len(results):,} images analyzed (saved to {IMAGE_RESULTS_TABLE}):")
+        st.dataframe(results, hide_index=True, use_container_width=True)
 
 def mmimage():
     """Multi-modal image analysis functionality using Snowflake Cortex AI"""
@@ -392,6 +2266,21 @@ def mmimage():
 
     # Create stage if it doesn't exist
     ensure_stage_exists(stage_name_no_at)
+    render_stage_refresh()
+
+    # Multi-modal models that can process images
+    model_list = models_for("image")
+
+    # Default prompt for image analysis
+    image_default_model_instruct = """Please provide the type of animal, breed, and environment in JSON format:
+            Animal: ??,
+            Breed: ??,
+            Environment: ??"""
+
+    # Batch mode analyzes many images with one query over the stage directory table
+    if st.toggle("Batch mode", help="Analyze many images (or everything on the stage) in one query"):
+        render_image_batch(stage_name_no_at, model_list, image_default_model_instruct)
+        return
 
     # -------------------------
     # File upload section
@@ -403,35 +2292,24 @@ def mmimage():
     uploaded_file = st.file_uploader("Choose a file")
 
     if uploaded_file:
-        # List of multi-modal models that can process images
-        model_list = [
-            "pixtral-large",
-            "claude-3-7-sonnet",
-            "claude-4-sonnet"
-        ]
-
         # Get file extension for processing logic
         file_extension = os.path.splitext(uploaded_file.name)[1].lower()
 
         try:
-            # Create file stream using BytesIO and upload to Snowflake stage
-            file_stream = io.BytesIO(uploaded_file.getvalue())
-            session.file.put_stream(
-                file_stream,
-                f"{stage_name}/{uploaded_file.name}",
-                auto_compress=False,
-                overwrite=True
-            )
-            st.success(f"File '{uploaded_file.name}' has been uploaded successfully!")
-
             # Model selection for image analysis
             image_selected_model = st.selectbox("Which Multi-Modal Model:", model_list)
 
-            # Default prompt for image analysis
-            image_default_model_instruct = """Please provide the type of animal, breed, and environment in JSON format:
-            Animal: ??,
-            Breed: ??,
-            Environment: ??"""
+            # Downscale and re-encode for the selected model before uploading
+            preprocessing = render_image_preprocessing_options(image_selected_model, "image")
+            upload_name, upload_data = prepare_image_upload(
+                uploaded_file.name, uploaded_file, preprocessing
+            )
+
+            # Text files can be gzip-compressed on upload
+            compress = file_extension in COMPRESSIBLE_EXTENSIONS and st.toggle("Compress on upload (gzip)")
+
+            # Stream to a content-addressed path, skipping files already on the stage
+            file_path, file_hash = upload_to_stage(stage_name, upload_name, upload_data, compress=compress)
 
             # Text area for custom analysis instructions
             image_model_instruct = st.text_area(
@@ -443,10 +2321,13 @@ def mmimage():
 
             # Button to trigger image analysis
             if st.button("Image Details"):
-                # Call Snowflake Cortex complete function with image file
-                image_cortex_response = session.sql(
-                    f"select snowflake.cortex.ai_complete('{image_selected_model}','{image_model_instruct}',TO_FILE('{stage_name}', '{uploaded_file.name}')) as RESPONSE"
-                ).to_pandas().iloc[0]["RESPONSE"]
+                # Call Snowflake Cortex complete function with image file (memoized per image content)
+                image_cortex_response = run_cortex(
+                    "ai_complete_file", image_selected_model, image_model_instruct, {"file": file_hash},
+                    lambda: cortex.ai_complete_file(
+                        image_selected_model, image_model_instruct, stage_name, file_path
+                    )
+                )
 
                 # Display analysis results
                 st.write(image_cortex_response)
@@ -481,6 +2362,120 @@ def mmimage():
         except Exception as e:
             st.error(f"Error occurred while uploading file: {str(e)}")
 
+# -------------------------------------
+# Transcript results
+# -------------------------------------
+# Transcriptions keyed by audio content hash, reused when the same recording is uploaded again
+TRANSCRIPT_TABLE = "GENAI_TRANSCRIPTS"
+
+def ensure_transcript_table():
+    """Create the transcript results table once per session"""
+    if st.session_state.get("transcript_table_ready"):
+        return
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {TRANSCRIPT_TABLE} (
+            CONTENT_HASH STRING PRIMARY KEY,
+            FILE_NAME STRING,
+            TRANSCRIPT VARIANT,
+            CREATED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+    st.session_state["transcript_table_ready"] = True
+
+def transcribe_file(stage_name, file_path, file_hash, file_name):
+    """
+    Transcribe a staged recording, reusing earlier results for the same content
+
+    Looks in the session memo, then the transcript table, and only calls
+    AI_TRANSCRIBE when neither has a result for this content hash.
+
+    Args:
+        stage_name (str): Stage name with the @ prefix
+        file_path (str): Path relative to the stage root
+        file_hash (str): SHA-256 of the recording
+        file_name (str): Original file name, stored for reference
+
+    Returns:
+        dict: AI_TRANSCRIBE result object
+    """
+    def lookup_or_transcribe():
+        ensure_transcript_table()
+        rows = session.sql(
+            f"select TRANSCRIPT from {TRANSCRIPT_TABLE} where CONTENT_HASH = ?",
+            params=[file_hash]
+        ).collect()
+        if rows:
+            return parse_variant(rows[0]["TRANSCRIPT"])
+
+        transcript = cortex.transcribe(stage_name, file_path)
+        session.sql(
+            f"""merge into {TRANSCRIPT_TABLE} t
+                using (select ? as CONTENT_HASH, ? as FILE_NAME, parse_json(?) as TRANSCRIPT) s
+                on t.CONTENT_HASH = s.CONTENT_HASH
+                when not matched then insert (CONTENT_HASH, FILE_NAME, TRANSCRIPT)
+                values (s.CONTENT_HASH, s.FILE_NAME, s.TRANSCRIPT)""",
+            params=[file_hash, file_name, json.dumps(transcript)]
+        ).collect()
+        return transcript
+
+    return run_cortex("transcribe", None, "", {"file": file_hash}, lookup_or_transcribe, persist=False)
+
+# -------------------------------------
+# Parallel transcription of long audio
+# -------------------------------------
+def transcribe_long_audio(stage_name, uploaded_file, file_hash, file_extension,
+                          segment_seconds, overlap_seconds):
+    """
+    Transcribe a long recording as overlapping segments in one set-based query
+
+    Args:
+        stage_name (str): Stage name with the @ prefix
+        uploaded_file: Streamlit UploadedFile
+        file_hash (str): SHA-256 of the recording
+        file_extension (str): One of SEGMENTABLE_EXTENSIONS
+        segment_seconds (float): Length of each segment
+        overlap_seconds (float): Overlap between consecutive segments
+
+    Returns:
+        dict: Stitched transcript with per-segment details
+    """
+    def run():
+        prefix = f"{file_hash}/segments-{segment_seconds}-{overlap_seconds}"
+
+        # Each segment is uploaded as soon as it is cut, so the whole split is never held in memory
+        registry = get_stage_registry()
+        registry.list_objects(stage_name, f"{prefix}/")
+        segments = split_audio(uploaded_file, file_extension, segment_seconds, overlap_seconds)
+        status = st.empty()
+        paths = registry.put_objects(
+            stage_name,
+            ((f"{prefix}/{index:04d}{file_extension}", segment) for index, segment in enumerate(segments)),
+            on_progress=lambda done: status.caption(f"Uploaded {done} segments...")
+        )
+        status.empty()
+
+        # One query over all segments lets the warehouse transcribe them concurrently
+        with st.spinner(f"Transcribing {len(paths)} segments..."), cortex.traced("ai_transcribe_segments"):
+            rows = session.sql(
+                """select s.value:i::int as SEGMENT, AI_TRANSCRIBE(TO_FILE(?, s.value:p::string)) as TRANSCRIPT
+                   from table(flatten(parse_json(?))) s
+                   order by SEGMENT""",
+                params=[stage_name, json.dumps([{"i": i, "p": p} for i, p in enumerate(paths)])]
+            ).collect()
+
+        texts = [parse_variant(row["TRANSCRIPT"]).get("text", "") for row in rows]
+        # Roughly three spoken words per second in the overlap window
+        return {
+            "text": stitch_transcripts(texts, max(int(overlap_seconds * 3), 1)),
+            "segments": [{"segment": i, "path": p, "text": t} for i, (p, t) in enumerate(zip(paths, texts))],
+        }
+
+    return run_cortex(
+        "transcribe_long", None, "",
+        {"file": file_hash, "segment_seconds": segment_seconds, "overlap_seconds": overlap_seconds},
+        run
+    )
+
 def mmaudio():
     """Audio transcription functionality using Snowflake AI"""
     st.title("Audio Transcription")
@@ -498,6 +2493,12 @@ def mmaudio():
 
     # Create stage if it doesn't exist
     ensure_stage_exists(stage_name_no_at)
+    render_stage_refresh()
+
+    # Transcribe recordings dropped onto the stage that have not been processed yet
+    if st.toggle("Process stage files", help="Transcribe only new or changed recordings on the stage"):
+        render_incremental_processing(stage_name_no_at, "audio", "AI_TRANSCRIBE", "")
+        return
 
     # -------------------------
     # Audio file upload section
@@ -512,16 +2513,25 @@ def mmaudio():
         # Get file extension
         file_extension = os.path.splitext(uploaded_file.name)[1].lower()
 
+        # Long recordings are split into overlapping segments and transcribed in parallel
+        long_audio = st.toggle(
+            "Long-audio mode", disabled=file_extension not in SEGMENTABLE_EXTENSIONS,
+            help="Split WAV/MP3 recordings into overlapping segments transcribed concurrently"
+        )
+        if long_audio:
+            col1, col2 = st.columns(2)
+            with col1:
+                segment_seconds = st.slider("Segment length (seconds)", 60, 900, 300, step=30)
+            with col2:
+                overlap_seconds = st.slider("Overlap (seconds)", 0, 30, 5)
+
         try:
-            # Create file stream using BytesIO and upload to Snowflake stage
-            file_stream = io.BytesIO(uploaded_file.getvalue())
-            session.file.put_stream(
-                file_stream,
-                f"{stage_name}/{uploaded_file.name}",
-                auto_compress=False,
-                overwrite=True
-            )
-            st.success(f"File '{uploaded_file.name}' has been uploaded successfully!")
+            if long_audio:
+                # Only the segments are uploaded in long-audio mode
+                file_hash = content_hash(uploaded_file)
+            else:
+                # Stream to a content-addressed path, skipping files already on the stage
+                file_path, file_hash = upload_to_stage(stage_name, uploaded_file.name, uploaded_file)
 
             # Custom CSS styling for audio player
             style_css = """
@@ -535,17 +2545,22 @@ def mmaudio():
                 "<style>" + style_css + "</style>", unsafe_allow_html=True
             )
 
-            # Create reference to uploaded audio file
-            audio_input = stage_name + "/" + uploaded_file.name
-
-            # Get audio file stream from Snowflake stage and display audio player
-            aud = session.file.get_stream(audio_input)
-            st.audio(aud, format='audio/mpeg')
-
-            # Call Snowflake AI transcription function
-            audio_cortex_response = session.sql(
-                f"SELECT AI_TRANSCRIBE(TO_FILE('{stage_name}/{uploaded_file.name}')) as RESPONSE"
-            ).to_pandas().iloc[0]["RESPONSE"]
+            # Display audio player from the local upload (no download from the stage)
+            uploaded_file.seek(0)
+            st.audio(uploaded_file, format='audio/mpeg')
+
+            if long_audio:
+                # Transcribe the segments in one set-based query and stitch them back together
+                audio_cortex_response = transcribe_long_audio(
+                    stage_name, uploaded_file, file_hash, file_extension,
+                    segment_seconds, overlap_seconds
+                )
+                st.dataframe(
+                    pd.DataFrame(audio_cortex_response["segments"]), hide_index=True, use_container_width=True
+                )
+            else:
+                # Call Snowflake AI transcription function (reused for recordings seen before)
+                audio_cortex_response = transcribe_file(stage_name, file_path, file_hash, uploaded_file.name)
 
             # Display transcription results
             st.write(audio_cortex_response)
@@ -567,6 +2582,66 @@ def read_svg(path):
         svg_string = f.read()
     return svg_string
 
+def metrics():
+    """Latency, token and cost dashboard over the traced Cortex calls"""
+    st.title("Cortex Call Metrics")
+    tracer = get_tracer()
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption(
+            f"{len(tracer.records)} calls in memory (last {TRACE_BUFFER_SIZE}), "
+            f"{tracer.unflushed} not yet written to {METRICS_TABLE}"
+        )
+    with col2:
+        # Exact token counts are computed in bulk at flush time
+        if st.button("Flush to table", disabled=not tracer.unflushed):
+            try:
+                with st.spinner("Counting tokens and writing metrics..."):
+                    written = tracer.flush(cortex)
+                st.success(f"Wrote {written} calls to {METRICS_TABLE}")
+            except Exception as e:
+                st.error(f"Error occurred while flushing metrics: {str(e)}")
+
+    calls = tracer.snapshot()
+    if calls.empty:
+        st.info("No Cortex calls recorded yet. Use any page and come back here.")
+        return
+
+    calls["model"] = calls["model"].fillna("")
+    calls["call"] = calls["function"] + calls["model"].map(lambda m: f" / {m}" if m else "")
+
+    # Percentile latency per function and model
+    st.subheader("Latency by Function and Model")
+    summary = calls.groupby("call").agg(
+        calls=("latency_s", "size"),
+        p50_s=("latency_s", lambda s: s.quantile(0.5)),
+        p95_s=("latency_s", lambda s: s.quantile(0.95)),
+        errors=("error", "count"),
+        input_tokens=("input_tokens", "sum"),
+        output_tokens=("output_tokens", "sum"),
+        estimated_credits=("estimated_credits", "sum"),
+    ).reset_index()
+    latency = summary.melt(
+        id_vars="call", value_vars=["p50_s", "p95_s"], var_name="percentile", value_name="seconds"
+    )
+    chart = alt.Chart(latency).mark_bar().encode(
+        x=alt.X("call:N", title=None, sort="-y"),
+        xOffset="percentile:N",
+        y=alt.Y("seconds:Q", title="Latency (s)"),
+        color=alt.Color("percentile:N", title="Percentile"),
+        tooltip=["call", "percentile", alt.Tooltip("seconds:Q", format=".2f")],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+    st.caption("Token counts are estimates until flushed; credits use approximate per-model rates.")
+
+    # Most recent calls first
+    st.subheader("Recent Calls")
+    st.dataframe(
+        calls.drop(columns=["call"]).iloc[::-1].head(200), hide_index=True, use_container_width=True
+    )
+
 # Dictionary mapping page names to their corresponding functions
 # This creates the navigation structure for the application
 page_names_to_funcs = {
@@ -577,13 +2652,34 @@ page_names_to_funcs = {
     "Summarize": supersum,                         # Text summarization
     "Next Best Action": nextba,                    # Next best action recommendations
     "Classify": classify,                          # Text classification
+    "Batch Analysis": batchcortex,                 # Set-based batch scoring of an uploaded file
+    "Transcript Insights": insights,               # All text analyses of one transcript in one query
     "Generate E-Mail": emailcomplete,              # Email generation
     "Ask a Question": askaquestion,                # General Q&A
-    "Multi-Modal Image Analysis": mmimage          # Image analysis
+    "Multi-Modal Image Analysis": mmimage,         # Image analysis
+    "Metrics": metrics                             # Cortex call latency, tokens and cost
 }
 
+# Warm the stage registry once per session (single SHOW STAGES query)
+get_stage_registry()
+
 # Sidebar navigation - creates dropdown menu for page selection
 selected_page = st.sidebar.selectbox("Select", page_names_to_funcs.keys())
 
-# Execute the selected page function
-page_names_to_funcs[selected_page]()
\ No newline at end of file
+# Response cache statistics below the page selector
+render_cache_stats()
+
+# Background jobs, polled without rerunning the page
+with st.sidebar:
+    render_job_list()
+
+# Execute the selected page function, attributing its Cortex calls to the page
+cortex.page = selected_page
+page_names_to_funcs[selected_page]()
+
+# Write metrics once enough calls have accumulated (GENAI_METRICS_FLUSH_EVERY)
+if METRICS_FLUSH_EVERY and get_tracer().unflushed >= METRICS_FLUSH_EVERY:
+    try:
+        get_tracer().flush(cortex)
+    except Exception:
+        pass  # Metrics are best effort; the next run retries
\ No newline at end of file